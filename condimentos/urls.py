@@ -1,16 +1,23 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.http import JsonResponse, FileResponse, Http404
+from django.http import JsonResponse, Http404
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.static import serve
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.middleware.csrf import get_token
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from core import image_cache, images, media
 from core.api.router import router
 from core.api.views import CartApiViewSet
 import os
 
+# Locations internas de nginx para X-Accel-Redirect (ver README_DOCKER.md)
+MEDIA_ACCEL_LOCATION = '/_media/'
+IMAGE_CACHE_ACCEL_LOCATION = '/_image-cache/'
+
 def api_root(request):
     # """Vista raíz que muestra información sobre la API"""
     return JsonResponse({
@@ -28,23 +35,49 @@ def serve_media(request, path):
     """
     Vista personalizada para servir archivos media en producción.
     Funciona tanto en desarrollo (DEBUG=True) como en producción (DEBUG=False).
+    Responde 304 y rangos de bytes, y con MEDIA_ACCEL_REDIRECT delega el
+    envío a nginx (ver core/media.py).
     """
-    file_path = os.path.join(settings.MEDIA_ROOT, path)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        # Determinar el tipo MIME basado en la extensión del archivo
-        ext = os.path.splitext(file_path)[1].lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.svg': 'image/svg+xml',
-        }
-        content_type = mime_types.get(ext, 'application/octet-stream')
-        return FileResponse(open(file_path, 'rb'), content_type=content_type)
+    try:
+        file_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Archivo no encontrado")
+    if os.path.isfile(file_path):
+        return media.file_response(
+            request, file_path, accel_path=MEDIA_ACCEL_LOCATION + path.lstrip('/'),
+        )
     raise Http404("Archivo no encontrado")
 
+def resize_media(request, width, height, path):
+    """
+    Imagen de MEDIA_ROOT reducida para caber en width x height (0 deja esa
+    dimensión libre). Se genera en la primera petición y luego se sirve
+    desde la caché en disco (ver core/image_cache.py). Solo se aceptan los
+    tamaños de la grilla de image_cache.size_allowed.
+    """
+    width, height = int(width), int(height)
+    if not image_cache.size_allowed(width, height):
+        raise Http404("Tamaño no permitido")
+
+    try:
+        file_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Archivo no encontrado")
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in image_cache.OUTPUT_FORMATS or not os.path.isfile(file_path):
+        raise Http404("Archivo no encontrado")
+
+    try:
+        cached = image_cache.get_resized(file_path, width, height)
+    except images.IMAGE_ERRORS:
+        raise Http404("No se pudo procesar la imagen")
+
+    return media.file_response(
+        request, cached,
+        accel_path=IMAGE_CACHE_ACCEL_LOCATION + os.path.relpath(cached, settings.IMAGE_CACHE_DIR),
+        immutable=False,
+    )
+
 @require_http_methods(["GET"])
 @ensure_csrf_cookie
 def get_csrf_token(request):
@@ -72,7 +105,8 @@ urlpatterns = [
     # Endpoint de debugging de sesiones
     path('api/debug-session/', CartApiViewSet.as_view({'get': 'debug_session'}), name='debug-session'),
 
-    # Servir archivos media (imágenes)
+    # Servir archivos media (imágenes), redimensionadas o tal cual
+    re_path(r'^images/(?P<width>\d+)x(?P<height>\d+)/(?P<path>.+)$', resize_media, name='resize_media'),
     re_path(r'^images/(?P<path>.*)$', serve_media, name='serve_media'),
 
     path('', api_root, name='home'),
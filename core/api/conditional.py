@@ -0,0 +1,100 @@
+"""
+Respuestas condicionales (ETag / Last-Modified) para los endpoints del
+catálogo.
+
+El ETag se deriva de la versión del catálogo (``core.catalog``) y de los ids
+de productos que hay en el carrito, porque cada producto serializado incluye
+``session.in_cart``; cuando se pide ``?session=0`` la respuesta no depende de
+la cookie y puede guardarse en caches compartidas. Si el cliente envía un ``If-None-Match`` que coincide se
+responde 304 antes de ejecutar la vista, es decir, sin evaluar querysets ni
+serializar nada.
+
+La versión del catálogo solo cambia con las señales de los modelos (y al
+migrar, ver ``core.signals``); por eso el ETag lleva además una sal con
+``settings.APP_VERSION`` y las migraciones del código desplegado, para que
+un despliegue que cambia la forma de las respuestas no reciba 304 con
+representaciones viejas. Last-Modified solo se usa en las respuestas sin
+datos de sesión: su resolución de un segundo no refleja cambios del carrito.
+"""
+import hashlib
+from functools import lru_cache, wraps
+
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.conf import settings
+from django.db.migrations.loader import MigrationLoader
+from django.utils.http import http_date, quote_etag
+
+from core import catalog
+from core.cart_store import get_cart_store
+from core.api.serializers import include_session_field
+
+
+def cart_fingerprint(request):
+    """
+    Resumen corto de los ids de producto que hay en el carrito.
+    """
+    cart = get_cart_store().load(request)
+    if not cart:
+        return '0'
+    keys = ','.join(sorted(str(key) for key in cart))
+    return hashlib.sha1(keys.encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def etag_salt():
+    """
+    Resumen de la versión de la aplicación y de las migraciones del código
+    (se calcula una vez por proceso).
+    """
+    migrations = MigrationLoader(None, ignore_no_migrations=True).disk_migrations
+    parts = [settings.APP_VERSION, *(f'{app}.{name}' for app, name in sorted(migrations))]
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()[:8]
+
+
+def catalog_etag(request, include_session=True):
+    etag = f'{etag_salt()}-v{catalog.get_version()}'
+    if not include_session:
+        return quote_etag(etag)
+    return quote_etag(f'{etag}-c{cart_fingerprint(request)}')
+
+
+def conditional_catalog(view_method):
+    """
+    Decorador para métodos de ViewSet que sirven datos del catálogo.
+    Agrega ETag, Last-Modified y Cache-Control a las respuestas 200 y responde
+    304 cuando If-None-Match / If-Modified-Since siguen siendo válidos.
+    Las respuestas con datos de sesión solo se validan con el ETag.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        include_session = include_session_field(request)
+        etag = catalog_etag(request, include_session)
+        last_modified = None if include_session else catalog.get_last_modified()
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if include_session:
+            # La respuesta depende de la cookie de sesión (in_cart): el
+            # navegador puede guardarla pero debe revalidar siempre
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE
+            )
+        return response
+
+    return wrapper
@@ -1,31 +1,80 @@
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer, StringRelatedField
+from core import images
+from core.cart_store import get_cart_store
 from core.models import Product, Collection
 
+
+def cart_product_ids(request):
+    """
+    Ids (en texto) de los productos que hay en el carrito de la petición.
+    """
+    if request is None:
+        return frozenset()
+    return frozenset(str(key) for key in get_cart_store().load(request))
+
+
+def include_session_field(request):
+    """
+    Los clientes pueden pedir ?session=0 para omitir el campo `session`
+    (in_cart) y obtener una respuesta que no depende de la cookie.
+    """
+    if request is None:
+        return True
+    return request.GET.get('session', '').lower() not in ('0', 'false', 'no')
+
+
+def product_serializer_context(request):
+    """
+    Contexto para ProductSerializer: calcula una sola vez por petición los
+    ids del carrito (o indica que se omita el campo `session`).
+    """
+    include_session = include_session_field(request)
+    context = {'request': request, 'include_session': include_session}
+    if include_session:
+        context['cart_ids'] = cart_product_ids(request)
+    return context
+
+
 class SessionSerializer(serializers.Serializer):
     session_key = serializers.CharField()
 
 class ProductSerializer(ModelSerializer):
     session = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     image = serializers.ImageField(
         max_length=None, allow_empty_file=False, allow_null=True, use_url=True, required=False)
     class Meta:
         model = Product
-        fields = ['id','name', 'measurement', 'description','available','featured','image','category', 'session']
+        fields = ['id','name', 'measurement', 'description','available','featured','image','category', 'session',
+                  'image_width', 'image_height', 'srcset']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # context['include_session'] = False omite el campo por completo
+        if not self.context.get('include_session', True):
+            self.fields.pop('session', None)
 
     def get_session(self, obj):
+        # Las vistas pasan en el contexto el conjunto de ids del carrito; si no
+        # está, se calcula una sola vez y se reutiliza para toda la lista
+        cart_ids = self.context.get('cart_ids')
+        if cart_ids is None:
+            cart_ids = cart_product_ids(self.context.get('request'))
+            self.context['cart_ids'] = cart_ids
+        return {'in_cart': str(obj.id) in cart_ids}
+
+    def get_srcset(self, obj):
+        # {"webp": {"160": url, "320": url, ...}, "jpeg": {...}}; URLs
+        # absolutas, igual que `image`
+        result = images.srcset(obj.image_derivatives)
         request = self.context.get('request')
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.save()
-            session_key = request.session.session_key
-        status = False
-        cart = request.session.get('cart', {})
-        for key, product in cart.items():
-            if key == str(obj.id):
-                status = True
-        return {'in_cart': status}
+        if request is not None:
+            for urls in result.values():
+                for width, url in urls.items():
+                    urls[width] = request.build_absolute_uri(url)
+        return result
 
 class CollectionSerializer(ModelSerializer):
     collection_products = ProductSerializer(many=True)
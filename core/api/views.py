@@ -1,58 +1,126 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.contrib.sessions.models import Session
+from rest_framework.permissions import AllowAny
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from core import autocomplete, catalog, counts, fuzzy, search
+from core.cart_store import get_cart_store
+from core.sessions import purge_sessions, session_inventory, sessions_summary
 from core.models import Product
-from .serializers import ProductSerializer
+from core.pagination import (
+    CURSOR_DEFAULT_PAGE_SIZE, CURSOR_MAX_PAGE_SIZE, CURSOR_ORDERINGS, keyset_page,
+)
+from .conditional import conditional_catalog
+from .serializers import ProductSerializer, product_serializer_context
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Count
-import threading
+from django.db.models import Q
+import json
+
+# Límites de sugerencias del autocompletado
+AUTOCOMPLETE_DEFAULT_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+# Máximo de operaciones aceptadas por /api/cart/batch/
+CART_BATCH_MAX_OPERATIONS = 200
+
+# Paginación de /api/cart/list_sessions/
+SESSIONS_PAGE_SIZE = 100
+SESSIONS_MAX_PAGE_SIZE = 1000
+SESSIONS_STREAM_CHUNK_SIZE = 2000
+
+# Totales del resumen del carrito que se mantienen por diferencias
+SUMMARY_KEYS = ('total_items', 'total_units', 'total_grams')
+
+def cursor_page(request, ordering='id', category=None):
+    """
+    Página del snapshot en modo cursor (?cursor=, vacío para la primera).
+    page_size se limita a CURSOR_MAX_PAGE_SIZE y el total solo se incluye
+    con ?count=1. Lanza ValueError si los parámetros son inválidos.
+    """
+    page_size = int(request.query_params.get('page_size', CURSOR_DEFAULT_PAGE_SIZE))
+    if page_size < 1:
+        raise ValueError('page_size debe ser mayor que 0.')
+    page_size = min(page_size, CURSOR_MAX_PAGE_SIZE)
+
+    records, keys = catalog.get_snapshot().ordered(ordering, category)
+    products, pagination = keyset_page(
+        records, keys, ordering, request.query_params.get('cursor'), page_size
+    )
+    if request.query_params.get('count', '').lower() in ('1', 'true', 'yes'):
+        pagination['total_products'] = len(records)
+    return products, pagination
+
+
+class CatalogContextMixin:
+    """
+    Pasa a ProductSerializer los ids del carrito precalculados, para que
+    `session.in_cart` sea una búsqueda O(1) por producto.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update(product_serializer_context(self.request))
+        return context
 
-# Lock para prevenir múltiples sesiones simultáneas
-session_lock = threading.Lock()
 
 class CartApiViewSet(viewsets.ModelViewSet):
     """
-    ViewSet para manejar el carrito de compras usando sesiones de Django.
+    ViewSet para manejar el carrito de compras.
+    El carrito se guarda con el backend configurado en settings.CART_STORE
+    (sesión de Django por defecto, ver core/cart_store.py).
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    @property
+    def cart_store(self):
+        return get_cart_store()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        return self.cart_store.process_response(request, response)
+
     def _ensure_session(self, request):
         """
-        Asegura que existe una sesión válida.
+        Crea la sesión si el carrito vive en ella y todavía no existe.
+        No necesita locks: SessionStore.create() genera una clave aleatoria
+        y, si choca con otra, la restricción única de session_key hace fallar
+        el INSERT y se reintenta con una clave nueva.
         """
-        with session_lock:
-            if not request.session.session_key:
-                has_cart_data = request.data.get('cart') or request.data.get('product_id')
-                has_cart_in_session = request.session.get('cart', {})
-
-                if has_cart_data or has_cart_in_session:
-                    request.session.create()
-                else:
-                    pass
-            else:
-                pass
-
+        if self.cart_store.uses_session and not request.session.session_key:
+            request.session.create()
         return request.session
 
     def _get_cart(self, request):
         """
-        Obtiene el carrito de la sesión actual.
+        Obtiene el carrito de la petición actual en formato compacto
+        {product_id: [cantidad, medida]}. Las líneas guardadas con el formato
+        anterior (copia completa del producto) se convierten al leerlas.
         """
-        cart = request.session.get('cart', {})
-        if not isinstance(cart, dict):
-            return {}
-        return cart
-
-    def _save_cart(self, request, cart):
+        cart = self.cart_store.load(request)
+        if all(isinstance(line, list) for line in cart.values()):
+            return cart
+
+        compact = {}
+        for key, line in cart.items():
+            parts = self._line_parts(line)
+            if parts is not None:
+                compact[key] = self._compact_line(*parts)
+        return compact
+
+    def _save_cart(self, request, cart, summary=None):
         """
-        Guarda el carrito en la sesión.
+        Guarda el carrito (y su resumen) con el backend configurado.
         """
-        request.session['cart'] = cart
-        request.session.modified = True
-        request.session.save()
+        if not cart and self.cart_store.uses_session and not request.session.session_key:
+            # Carrito vacío y sin sesión: no hay nada que guardar y marcar la
+            # sesión como modificada haría que el middleware la creara
+            return
+        self.cart_store.save(request, cart, summary)
+        # La sesión se crea recién con la primera línea del carrito
+        if cart:
+            self._ensure_session(request)
 
     def _convert_to_grams(self, cantidad, measurement, display_value=None):
         """
@@ -81,31 +149,60 @@ class CartApiViewSet(viewsets.ModelViewSet):
             return display_value
         return cantidad
 
-    def _extract_existing_weight(self, item):
+    def _line_parts(self, item):
         """
-        Obtiene la cantidad en gramos almacenada previamente.
+        Normaliza una línea del carrito a (cantidad, medida, última medida).
+        Acepta el formato compacto [cantidad, medida(, última medida)] y el
+        formato anterior, que guardaba un dict con los datos del producto.
         """
-        if not item:
-            return 0
+        if isinstance(item, (list, tuple)) and len(item) >= 2:
+            last_measurement = item[2] if len(item) > 2 else item[1]
+            return item[0], item[1], last_measurement
+
+        if not isinstance(item, dict):
+            return None
 
-        if 'cantidad_total_gramos' in item:
+        last_measurement = item.get('last_measurement') or item.get('medida')
+        if item.get('medida') == 'un' or item.get('cantidad_total_unidades'):
             try:
-                return float(item['cantidad_total_gramos'])
+                return int(item.get('cantidad', 0)), 'un', last_measurement
             except (TypeError, ValueError):
-                return 0
+                return 0, 'un', last_measurement
 
-        medida = (item.get('medida') or '').lower()
-        cantidad = item.get('cantidad', 0)
         try:
-            cantidad = float(cantidad)
+            if 'cantidad_total_gramos' in item:
+                return float(item['cantidad_total_gramos']), 'gm', last_measurement
+            cantidad = float(item.get('cantidad', 0))
         except (TypeError, ValueError):
-            cantidad = 0
+            return 0, 'gm', last_measurement
 
+        medida = (item.get('medida') or '').lower()
         if medida == 'kg':
-            return cantidad * 1000
+            return cantidad * 1000, 'gm', last_measurement
         if medida == 'gm':
-            return cantidad
-        return 0
+            return cantidad, 'gm', last_measurement
+        return 0, 'gm', last_measurement
+
+    def _compact_line(self, cantidad, medida, last_measurement=None):
+        """
+        Línea compacta que se guarda en el carrito: [cantidad, medida] y la
+        última medida usada solo si es distinta (p. ej. 'kg' para 'gm').
+        """
+        if last_measurement and last_measurement != medida:
+            return [cantidad, medida, last_measurement]
+        return [cantidad, medida]
+
+    def _extract_existing_weight(self, item):
+        """
+        Obtiene la cantidad en gramos almacenada previamente.
+        """
+        parts = self._line_parts(item)
+        if parts is None or parts[1] != 'gm':
+            return 0
+        try:
+            return float(parts[0])
+        except (TypeError, ValueError):
+            return 0
 
     def _format_weight(self, grams):
         """
@@ -123,13 +220,145 @@ class CartApiViewSet(viewsets.ModelViewSet):
         return " ".join(parts)
 
     def _extract_existing_units(self, item):
-        if not item:
+        parts = self._line_parts(item)
+        if parts is None:
             return 0
         try:
-            return int(item.get('cantidad', 0))
+            return int(parts[0])
         except (TypeError, ValueError):
             return 0
 
+    def _build_cart_entry(self, product, existing_item, cantidad, measurement, display_value=None):
+        """
+        Calcula la línea compacta del carrito de `product` sumando `cantidad`
+        a la línea existente (o partiendo de cero si `existing_item` es None).
+        Retorna (línea, total de unidades, total de gramos) de esa línea.
+        """
+        measurement = (measurement or "").lower()
+
+        if measurement == 'un' or product.measurement == 'un':
+            unidades_actuales = self._extract_existing_units(existing_item)
+            try:
+                unidades_a_agregar = int(cantidad)
+            except (TypeError, ValueError):
+                unidades_a_agregar = 0
+            total_unidades = unidades_actuales + unidades_a_agregar
+            return self._compact_line(total_unidades, 'un', measurement), total_unidades, 0
+
+        gramos_a_agregar = self._convert_to_grams(
+            cantidad, measurement, display_value
+        )
+        gramos_existentes = self._extract_existing_weight(existing_item)
+        total_gramos = gramos_existentes + gramos_a_agregar
+        return self._compact_line(total_gramos, 'gm', measurement), 0, total_gramos
+
+    def _hydrate_line(self, product_id, item, record):
+        """
+        Arma la línea completa de la respuesta a partir de la línea compacta
+        y del producto del snapshot del catálogo (None si ya no existe).
+        """
+        cantidad, medida, last_measurement = self._line_parts(item)
+        image = record.image if record is not None else None
+        entry = {
+            'id': record.id if record is not None else product_id,
+            'name': record.name if record is not None else None,
+            'description': record.description if record is not None else None,
+            'image': image.url if image else None,
+            'last_measurement': last_measurement,
+        }
+
+        if medida == 'un':
+            entry.update(
+                {
+                    'cantidad': cantidad,
+                    'medida': 'un',
+                    'cantidad_total_unidades': cantidad,
+                    'cantidad_formateada': f"{cantidad} unidades",
+                }
+            )
+        else:
+            total_gramos = self._extract_existing_weight(item)
+            entry.update(
+                {
+                    'cantidad': total_gramos,
+                    'medida': 'gm',
+                    'cantidad_total_gramos': total_gramos,
+                    'cantidad_formateada': self._format_weight(total_gramos),
+                    'cantidad_detalle': {
+                        'kg': int(total_gramos // 1000),
+                        'gm': int(total_gramos % 1000),
+                    },
+                }
+            )
+        return entry
+
+    def _hydrate_cart(self, cart):
+        """
+        Completa todas las líneas del carrito con los datos actuales de los
+        productos, tomados del snapshot del catálogo (sin consultas).
+        """
+        snapshot = catalog.get_snapshot()
+        return {
+            key: self._hydrate_line(key, item, snapshot.get(key))
+            for key, item in cart.items()
+        }
+
+    def _line_totals(self, item):
+        """
+        Aporte de una línea del carrito a (total_items, total_units, total_grams).
+        """
+        parts = self._line_parts(item)
+        if parts is None:
+            return 0, 0, 0
+        units = self._extract_existing_units(item)
+        # Para productos por unidad, total_items debe reflejar el número de unidades agregadas
+        # Para productos por peso, total_items es el número de productos únicos
+        if parts[1] == 'un':
+            items = units
+        else:
+            items = 1
+        return items, units, self._extract_existing_weight(item)
+
+    def _cart_summary(self, cart):
+        """
+        Recalcula desde cero los totales del carrito (O(líneas)).
+        Solo se usa cuando el resumen guardado falta o no es consistente.
+        """
+        summary = {'total_items': 0, 'total_units': 0, 'total_grams': 0, 'lines': len(cart)}
+        for item in cart.values():
+            items, units, grams = self._line_totals(item)
+            summary['total_items'] += items
+            summary['total_units'] += units
+            summary['total_grams'] += grams
+        return summary
+
+    def _get_summary(self, request, cart):
+        """
+        Resumen guardado junto al carrito; si falta o no coincide con el
+        número de líneas se repara recalculándolo.
+        """
+        summary = self.cart_store.load_summary(request)
+        if (
+            not isinstance(summary, dict)
+            or summary.get('lines') != len(cart)
+            or any(not isinstance(summary.get(key), (int, float)) for key in SUMMARY_KEYS)
+        ):
+            return self._cart_summary(cart)
+        return dict(summary)
+
+    def _update_summary(self, summary, old_item, new_item):
+        """
+        Aplica al resumen la diferencia entre la línea anterior y la nueva
+        (None si la línea no existía o se eliminó). O(1).
+        """
+        old_totals = self._line_totals(old_item)
+        new_totals = self._line_totals(new_item)
+        for key, old, new in zip(SUMMARY_KEYS, old_totals, new_totals):
+            summary[key] += new - old
+        summary['total_grams'] = round(summary['total_grams'], 3)
+        summary['lines'] += (new_item is not None) - (old_item is not None)
+        return summary
+
     def list(self, request, *args, **kwargs):
         """
         Obtener el contenido actual del carrito.
@@ -139,40 +368,10 @@ class CartApiViewSet(viewsets.ModelViewSet):
             # Obtener el carrito de la sesión actual
             cart = self._get_cart(request)
             session = request.session
-
-            # Calcular total_items considerando productos por unidad
-            # Para productos por unidad, total_items debe reflejar el número de unidades agregadas
-            # Para productos por peso, total_items es el número de productos únicos
-            total_items = 0
-            for item in cart.values():
-                if not isinstance(item, dict):
-                    continue
-                if item.get('medida') == 'un' or item.get('cantidad_total_unidades'):
-                    # Producto por unidad: contar las unidades
-                    unidades = self._extract_existing_units(item)
-                    total_items += unidades
-                else:
-                    # Producto por peso: contar como 1 producto único
-                    total_items += 1
-
-            transformed_cart = {}
-            for key, item in cart.items():
-                if not isinstance(item, dict):
-                    continue
-                transformed = dict(item)
-
-                if 'cantidad_total_gramos' in item:
-                    try:
-                        grams = float(item['cantidad_total_gramos'])
-                        transformed['cantidad_total_gramos'] = grams
-                        transformed['cantidad_formateada'] = self._format_weight(grams)
-                    except (TypeError, ValueError):
-                        pass
-
-                transformed_cart[key] = transformed
+            total_items = self._get_summary(request, cart)['total_items']
 
             return Response({
-                'cart': transformed_cart,
+                'cart': self._hydrate_cart(cart),
                 'session_key': request.session.session_key,
                 'total_items': total_items,
                 'item_count': total_items,  # Agregar item_count para compatibilidad con frontend
@@ -210,101 +409,30 @@ class CartApiViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # Asegurar que existe una sesión
-            self._ensure_session(request)
-
             # Obtener el carrito actual
             cart = self._get_cart(request)
+            summary = self._get_summary(request, cart)
             cart_key = str(product_id)
             existing_item = cart.get(cart_key)
 
-            measurement = (measurement or "").lower()
-
-
-            # Agregar o actualizar el producto en el carrito
-            cart_total_grams = 0
-            cart_total_units = 0
-
-            cart_entry = {
-                'id': product.id,
-                'name': product.name,
-                'description': product.description,
-                'image': product.image.url if product.image else None,
-                'added_at': timezone.now().isoformat(),
-                'last_measurement': measurement,
-            }
-
-            if measurement == 'un' or product.measurement == 'un':
-                unidades_actuales = self._extract_existing_units(existing_item)
-                try:
-                    unidades_a_agregar = int(cantidad)
-                except (TypeError, ValueError):
-                    unidades_a_agregar = 0
-                total_unidades = unidades_actuales + unidades_a_agregar
-                cart_total_units = total_unidades
-                cart_entry.update(
-                    {
-                        'cantidad': total_unidades,
-                        'medida': 'un',
-                        'cantidad_total_unidades': total_unidades,
-                        'cantidad_formateada': f"{total_unidades} unidades",
-                    }
-                )
-            else:
-                gramos_a_agregar = self._convert_to_grams(
-                    cantidad, measurement, display_value
-                )
-                gramos_existentes = self._extract_existing_weight(existing_item)
-                total_gramos = gramos_existentes + gramos_a_agregar
-                cart_entry.update(
-                    {
-                        'cantidad': total_gramos,
-                        'medida': 'gm',
-                        'cantidad_total_gramos': total_gramos,
-                        'cantidad_formateada': self._format_weight(total_gramos),
-                        'cantidad_detalle': {
-                            'kg': int(total_gramos // 1000),
-                            'gm': int(total_gramos % 1000),
-                        },
-                    }
-                )
-                cart_total_grams = total_gramos
-
+            cart_entry, cart_total_units, cart_total_grams = self._build_cart_entry(
+                product, existing_item, cantidad, measurement, display_value
+            )
             cart[cart_key] = cart_entry
+            self._update_summary(summary, existing_item, cart_entry)
 
             # Guardar el carrito en la sesión
-            self._save_cart(request, cart)
-
-            # Calcular total_items considerando productos por unidad
-            # Para productos por unidad, total_items debe reflejar el número de unidades agregadas
-            # Para productos por peso, total_items es el número de productos únicos
-            total_items = 0
-            for item in cart.values():
-                if item.get('medida') == 'un' or item.get('cantidad_total_unidades'):
-                    # Producto por unidad: contar las unidades
-                    unidades = self._extract_existing_units(item)
-                    total_items += unidades
-                else:
-                    # Producto por peso: contar como 1 producto único
-                    total_items += 1
-
-            total_units = sum(
-                self._extract_existing_units(item) for item in cart.values()
-            )
-            total_grams = sum(
-                self._extract_existing_weight(item) for item in cart.values()
-            )
+            self._save_cart(request, cart, summary)
 
+            hydrated_cart = self._hydrate_cart(cart)
             return Response({
-                'cart': cart,
+                'cart': hydrated_cart,
                 'message': f'Producto "{product.name}" agregado al carrito',
-                'added_product': cart[cart_key],
+                'added_product': hydrated_cart[cart_key],
                 'session_key': request.session.session_key,
-                'item_count': total_items,  # Agregar item_count para compatibilidad con frontend
+                'item_count': summary['total_items'],  # Agregar item_count para compatibilidad con frontend
                 'summary': {
-                    'total_items': total_items,
-                    'total_units': total_units,
-                    'total_grams': total_grams,
+                    **summary,
                     'cart_total_units': cart_total_units,
                     'cart_total_grams': cart_total_grams,
                 },
@@ -345,15 +473,28 @@ class CartApiViewSet(viewsets.ModelViewSet):
                 )
 
             # Actualizar la cantidad
-            cart[product_id]['cantidad'] = new_cantidad
+            previous_item = cart[product_id]
+            _, medida, last_measurement = self._line_parts(previous_item)
+            try:
+                new_cantidad = int(new_cantidad) if medida == 'un' else float(new_cantidad)
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": "cantidad inválida."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            summary = self._get_summary(request, cart)
+            cart[product_id] = self._compact_line(new_cantidad, medida, last_measurement)
+            self._update_summary(summary, previous_item, cart[product_id])
 
             # Guardar el carrito en la sesión
-            self._save_cart(request, cart)
+            self._save_cart(request, cart, summary)
 
+            hydrated_cart = self._hydrate_cart(cart)
             return Response({
-                'cart': cart,
+                'cart': hydrated_cart,
                 'message': f'Cantidad actualizada para tipo de producto {product_id}',
-                'updated_product': cart[product_id],
+                'updated_product': hydrated_cart[product_id],
                 'session_key': request.session.session_key
             })
 
@@ -386,26 +527,19 @@ class CartApiViewSet(viewsets.ModelViewSet):
                 )
 
             # Eliminar el producto del carrito
+            summary = self._get_summary(request, cart)
             removed_product = cart.pop(product_id)
+            self._update_summary(summary, removed_product, None)
 
             # Guardar el carrito en la sesión
-            self._save_cart(request, cart)
-
-            # Calcular total_items considerando productos por unidad
-            total_items = 0
-            for item in cart.values():
-                if not isinstance(item, dict):
-                    continue
-                if item.get('medida') == 'un' or item.get('cantidad_total_unidades'):
-                    # Producto por unidad: contar las unidades
-                    unidades = self._extract_existing_units(item)
-                    total_items += unidades
-                else:
-                    # Producto por peso: contar como 1 producto único
-                    total_items += 1
+            self._save_cart(request, cart, summary)
+            total_items = summary['total_items']
+            removed_product = self._hydrate_line(
+                product_id, removed_product, catalog.get_snapshot().get(product_id)
+            )
 
             return Response({
-                'cart': cart,
+                'cart': self._hydrate_cart(cart),
                 'message': f'Producto "{removed_product["name"]}" eliminado del carrito',
                 'removed_product': removed_product,
                 'session_key': request.session.session_key,
@@ -419,16 +553,129 @@ class CartApiViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Aplicar varias operaciones al carrito guardándolo una sola vez.
+        Endpoint: POST /api/cart/batch/
+        Body: {"operations": [
+            {"op": "add", "product_id": 1, "cantidad": 2, "measurement": "un"},
+            {"op": "update", "product_id": 2, "cantidad": 500, "measurement": "gm"},
+            {"op": "remove", "product_id": 3}
+        ]}
+        `add` suma la cantidad igual que POST /api/cart/, `update` la reemplaza
+        y `remove` elimina la línea. Las operaciones se aplican en orden; si
+        alguna es inválida no se aplica ninguna.
+        """
+        try:
+            operations = request.data.get('operations')
+            if not isinstance(operations, list) or not operations:
+                return Response(
+                    {"detail": "operations debe ser una lista no vacía."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(operations) > CART_BATCH_MAX_OPERATIONS:
+                return Response(
+                    {"detail": f"Máximo {CART_BATCH_MAX_OPERATIONS} operaciones por petición."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Resolver todos los productos con una sola consulta
+            product_ids = set()
+            for operation in operations:
+                if isinstance(operation, dict) and operation.get('op') in ('add', 'update'):
+                    try:
+                        product_ids.add(int(operation.get('product_id')))
+                    except (TypeError, ValueError):
+                        pass
+            products = Product.objects.in_bulk(product_ids)
+
+            cart = dict(self._get_cart(request))
+            summary = self._get_summary(request, cart)
+            results = []
+            errors = []
+
+            for index, operation in enumerate(operations):
+                if not isinstance(operation, dict):
+                    errors.append({'index': index, 'detail': 'Operación inválida.'})
+                    continue
+
+                op = operation.get('op')
+                cart_key = str(operation.get('product_id') or '')
+                if not cart_key:
+                    errors.append({'index': index, 'detail': 'product_id es requerido.'})
+                    continue
+
+                if op == 'remove':
+                    removed_item = cart.pop(cart_key, None)
+                    if removed_item is None:
+                        errors.append({'index': index, 'detail': 'Producto no encontrado en el carrito.'})
+                        continue
+                    self._update_summary(summary, removed_item, None)
+                elif op in ('add', 'update'):
+                    try:
+                        product = products.get(int(cart_key))
+                    except ValueError:
+                        product = None
+                    if product is None:
+                        errors.append({'index': index, 'detail': 'Producto no encontrado.'})
+                        continue
+
+                    existing_item = cart.get(cart_key)
+                    if op == 'update' and existing_item is None:
+                        errors.append({'index': index, 'detail': 'Producto no encontrado en el carrito.'})
+                        continue
+
+                    measurement = operation.get('measurement')
+                    if measurement is None:
+                        parts = self._line_parts(existing_item)
+                        measurement = parts[1] if parts else 'un'
+                    cart[cart_key], _, _ = self._build_cart_entry(
+                        product,
+                        existing_item if op == 'add' else None,
+                        operation.get('cantidad', 1),
+                        measurement,
+                        operation.get('display_value'),
+                    )
+                    self._update_summary(summary, existing_item, cart[cart_key])
+                else:
+                    errors.append({'index': index, 'detail': f'Operación desconocida: {op}.'})
+                    continue
+
+                results.append({'index': index, 'op': op, 'product_id': cart_key})
+
+            if errors:
+                return Response(
+                    {"detail": "No se aplicó ninguna operación.", "errors": errors},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Una sola escritura para todo el lote
+            self._save_cart(request, cart, summary)
+
+            return Response({
+                'cart': self._hydrate_cart(cart),
+                'results': results,
+                'session_key': request.session.session_key,
+                'item_count': summary['total_items'],
+                'summary': summary,
+            })
+
+        except Exception as e:
+            return Response(
+                {"detail": f"Error al actualizar el carrito: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=['post'])
     def clear_cart(self, request):
         """
         Limpiar todo el carrito.
         """
         try:
-            # Limpiar el carrito de la sesión
-            request.session['cart'] = {}
-            request.session.modified = True
-            request.session.save()
+            # Limpiar el carrito (si ya está vacío no se escribe nada)
+            if self._get_cart(request):
+                self._save_cart(request, {}, self._cart_summary({}))
 
             return Response({
                 'cart': {},
@@ -442,29 +689,56 @@ class CartApiViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _session_row(self, session_key, expire_date, cart_items, now):
+        return {
+            'session_key': session_key,
+            'expire_date': expire_date.isoformat() if expire_date else None,
+            'has_cart': cart_items is not None,
+            'cart_items': cart_items or 0,
+            'is_expired': expire_date <= now if expire_date else False,
+        }
+
+    def _stream_sessions(self, after):
+        now = timezone.now()
+        rows = session_inventory(after).iterator(chunk_size=SESSIONS_STREAM_CHUNK_SIZE)
+        for session_key, expire_date, cart_items in rows:
+            row = self._session_row(session_key, expire_date, cart_items, now)
+            yield json.dumps(row) + '\n'
+
     @action(detail=False, methods=['get'])
     def list_sessions(self, request):
         """
-        Listar todas las sesiones activas.
+        Listar las sesiones paginadas por cursor (session_key).
+        Endpoint: /api/cart/list_sessions/?cursor=<next_cursor>&limit=100
+        Con ?stream=1 se envían todas las sesiones (desde el cursor) como
+        NDJSON, una por línea, sin armar la lista en memoria.
+        Los totales están en /api/cart/sessions_summary/.
         """
         try:
-            sessions = Session.objects.all()
-            session_info = []
-
-            for session in sessions:
-                session_data = session.get_decoded()
-                session_info.append({
-                    'session_key': session.session_key,
-                    'expire_date': session.expire_date.isoformat() if session.expire_date else None,
-                    'has_cart': 'cart' in session_data,
-                    'cart_items': len(session_data.get('cart', {})),
-                    'is_expired': session.expire_date <= timezone.now() if session.expire_date else False
-                })
+            after = request.GET.get('cursor') or None
+
+            if request.GET.get('stream', '').lower() in ('1', 'true', 'yes'):
+                return StreamingHttpResponse(
+                    self._stream_sessions(after),
+                    content_type='application/x-ndjson',
+                )
+
+            try:
+                limit = int(request.GET.get('limit', SESSIONS_PAGE_SIZE))
+            except (TypeError, ValueError):
+                limit = SESSIONS_PAGE_SIZE
+            limit = max(1, min(limit, SESSIONS_MAX_PAGE_SIZE))
+
+            now = timezone.now()
+            # Se pide una fila de más para saber si hay otra página
+            rows = list(session_inventory(after)[:limit + 1])
+            session_info = [self._session_row(*row, now) for row in rows[:limit]]
+            next_cursor = session_info[-1]['session_key'] if len(rows) > limit else None
 
             return Response({
                 'sessions': session_info,
-                'total_sessions': len(session_info),
-                'active_sessions': len([s for s in session_info if not s['is_expired']])
+                'count': len(session_info),
+                'next_cursor': next_cursor,
             })
 
         except Exception as e:
@@ -473,23 +747,34 @@ class CartApiViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def sessions_summary(self, request):
+        """
+        Totales de sesiones (vigentes/vencidas) y de carritos con productos,
+        calculados con agregados SQL.
+        Endpoint: /api/cart/sessions_summary/
+        """
+        try:
+            return Response(sessions_summary())
+
+        except Exception as e:
+            return Response(
+                {"detail": f"Error al obtener el resumen de sesiones: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=False, methods=['post'])
     def clear_duplicate_sessions(self, request):
         """
         Limpiar sesiones duplicadas.
         """
         try:
-            sessions = Session.objects.all()
-            duplicate_count = 0
-
-            for session in sessions:
-                if session.expire_date <= timezone.now():
-                    session.delete()
-                    duplicate_count += 1
+            result = purge_sessions()
 
             return Response({
-                'message': f'Se eliminaron {duplicate_count} sesiones duplicadas',
-                'deleted_sessions': duplicate_count
+                'message': f'Se eliminaron {result["deleted"]} sesiones duplicadas',
+                'deleted_sessions': result['deleted'],
+                'elapsed': round(result['elapsed'], 3),
             })
 
         except Exception as e:
@@ -504,15 +789,12 @@ class CartApiViewSet(viewsets.ModelViewSet):
         Limpiar todas las sesiones.
         """
         try:
-            sessions = Session.objects.all()
-            total_count = len(sessions)
-
-            for session in sessions:
-                session.delete()
+            result = purge_sessions(expired_only=False)
 
             return Response({
-                'message': f'Se eliminaron {total_count} sesiones',
-                'deleted_sessions': total_count
+                'message': f'Se eliminaron {result["deleted"]} sesiones',
+                'deleted_sessions': result['deleted'],
+                'elapsed': round(result['elapsed'], 3),
             })
 
         except Exception as e:
@@ -521,26 +803,38 @@ class CartApiViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class QueryViewSet(viewsets.ModelViewSet):
+class QueryViewSet(CatalogContextMixin, viewsets.ModelViewSet):
     """
     ViewSet para búsqueda de productos con paginación.
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    @conditional_catalog
     def list(self, request, *args, **kwargs):
         """
         Obtener todos los productos con paginación.
         Endpoint: /api/consulta/?page=1
+        Paginación por cursor: /api/consulta/?cursor=&ordering=category
+        (ordering: id o category; luego ?cursor=<next_cursor>).
         """
         try:
             cookies = request.COOKIES
             print(f"[DEBUG] Cookies recibidas: {cookies}")
 
-            if not request.session.session_key:
-                request.session.create()
-                request.session["initialized"] = True
-                request.session.modified = True
+            # La sesión se crea recién al agregar algo al carrito; navegar el
+            # catálogo no escribe en la base
+
+            if 'cursor' in request.query_params:
+                ordering = request.query_params.get('ordering', 'id')
+                if ordering not in CURSOR_ORDERINGS:
+                    raise ValueError(f'ordering debe ser uno de: {", ".join(CURSOR_ORDERINGS)}.')
+                products, pagination = cursor_page(request, ordering)
+                serializer = self.get_serializer(products, many=True)
+                return Response({
+                    'products': serializer.data,
+                    'pagination': pagination,
+                })
 
             # Obtener parámetros de paginación
             page = int(request.query_params.get('page', 1))
@@ -549,9 +843,10 @@ class QueryViewSet(viewsets.ModelViewSet):
             # Calcular offset
             offset = (page - 1) * page_size
 
-            # Obtener productos con paginación
-            products = Product.objects.all()[offset:offset + page_size]
-            total_products = Product.objects.count()
+            # Obtener productos con paginación desde el snapshot del catálogo
+            snapshot = catalog.get_snapshot()
+            products = snapshot.products[offset:offset + page_size]
+            total_products = len(snapshot.products)
 
             # Calcular información de paginación
             total_pages = (total_products + page_size - 1) // page_size
@@ -587,6 +882,11 @@ class QueryViewSet(viewsets.ModelViewSet):
     def search(self, request):
         """
         Buscar productos por nombre o descripción.
+        Endpoint: /api/consulta/search/?q=anis&page=1&page_size=12
+        Usa el índice FTS5 (ranking BM25, sin distinguir acentos) cuando la
+        base de datos es SQLite y los índices GIN de pg_trgm con PostgreSQL.
+        Con ?fuzzy=1 se usa el índice de trigramas en memoria, que tolera
+        errores de tipeo ("bensoato" -> "benzoato").
         """
         try:
             query = (request.query_params.get('q', '') or '').strip()
@@ -602,20 +902,69 @@ class QueryViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Filtrar por nombre o descripción que contengan el texto
-            products = Product.objects.filter(
-                name__icontains=query
-            ) | Product.objects.filter(
-                description__icontains=query
-            )
+            try:
+                page = int(request.query_params.get('page', 1))
+                page_size = int(request.query_params.get('page_size', 12))
+                if page < 1 or page_size < 1:
+                    raise ValueError
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": "Parámetros de paginación inválidos."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            offset = (page - 1) * page_size
+            fuzzy_mode = request.query_params.get('fuzzy', '').lower() in ('1', 'true')
+
+            if fuzzy_mode:
+                ranked_ids = fuzzy.get_index().search(query)
+                total = len(ranked_ids)
+                snapshot = catalog.get_snapshot()
+                products = [
+                    snapshot.by_id[pk]
+                    for pk in ranked_ids[offset:offset + page_size]
+                    if pk in snapshot.by_id
+                ]
+            elif search.search_enabled():
+                # Una sola consulta al índice: ids ordenados (BM25 o
+                # similitud de trigramas) + total
+                product_ids, total = search.search_product_ids(
+                    query, limit=page_size, offset=offset
+                )
+                snapshot = catalog.get_snapshot()
+                products = [
+                    snapshot.by_id[pk] for pk in product_ids if pk in snapshot.by_id
+                ]
+            else:
+                # Filtrar por nombre o descripción que contengan el texto
+                products_qs = Product.objects.filter(
+                    Q(name__icontains=query) | Q(description__icontains=query)
+                ).order_by('id')
+                total = products_qs.count()
+                products = products_qs[offset:offset + page_size]
+
+            total_pages = (total + page_size - 1) // page_size
+            has_next = page < total_pages
+            has_previous = page > 1
 
             serializer = self.get_serializer(products, many=True)
 
             return Response(
                 {
                     "products": serializer.data,
-                    "total": products.count(),
+                    "total": total,
                     "query": query,
+                    "fuzzy": fuzzy_mode,
+                    "pagination": {
+                        "current_page": page,
+                        "page_size": page_size,
+                        "total_products": total,
+                        "total_pages": total_pages,
+                        "has_next": has_next,
+                        "has_previous": has_previous,
+                        "next_page": page + 1 if has_next else None,
+                        "previous_page": page - 1 if has_previous else None,
+                    },
                 }
             )
         except Exception as e:
@@ -624,8 +973,52 @@ class QueryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(
+        detail=False,
+        methods=['get'],
+        authentication_classes=[],
+        permission_classes=[AllowAny],
+    )
+    def autocomplete(self, request):
+        """
+        Sugerencias para búsqueda mientras se escribe.
+        Endpoint: /api/consulta/autocomplete/?q=can&limit=8
+        Se responde desde el índice de prefijos en memoria, sin consultas SQL
+        (tampoco se autentica para no cargar la sesión).
+        """
+        query = (request.query_params.get('q', '') or '').strip()
+
+        try:
+            limit = int(request.query_params.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT))
+            if limit < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "El parámetro limit es inválido."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(limit, AUTOCOMPLETE_MAX_LIMIT)
+
+        suggestions = autocomplete.get_index().suggest(query, limit=limit)
 
-class ProductViewSet(viewsets.ModelViewSet):
+        return Response(
+            {
+                "query": query,
+                "suggestions": [
+                    {
+                        "id": entry.id,
+                        "name": entry.name,
+                        "image": request.build_absolute_uri(entry.image)
+                        if entry.image
+                        else None,
+                    }
+                    for entry in suggestions
+                ],
+            }
+        )
+
+
+class ProductViewSet(CatalogContextMixin, viewsets.ModelViewSet):
     """
     ViewSet para manejar productos individuales.
     Endpoints: /api/item/{id}/ y /api/products/{id}/
@@ -634,22 +1027,23 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
 
 
+    @conditional_catalog
     def retrieve(self, request, *args, **kwargs):
         """
         Obtener un producto específico por ID.
         Endpoint: /api/item/{id}/
         """
         try:
-            product = self.get_object()
+            product = catalog.get_snapshot().get(kwargs.get(self.lookup_field))
+            if product is None:
+                return Response(
+                    {"detail": "Producto no encontrado."},
+                    status=status.HTTP_404_NOT_FOUND
+                )
             serializer = self.get_serializer(product)
             return Response({
                 'product': serializer.data
             })
-        except Product.DoesNotExist:
-            return Response(
-                {"detail": "Producto no encontrado."},
-                status=status.HTTP_404_NOT_FOUND
-            )
         except Exception as e:
             return Response(
                 {"detail": f"Error al obtener producto: {str(e)}"},
@@ -657,6 +1051,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['get'])
+    @conditional_catalog
     def featured(self, request):
         """
         Obtener productos destacados.
@@ -665,11 +1060,11 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         try:
             # Filtrar solo productos con featured=True
-            featured_products = Product.objects.filter(featured=True)
+            featured_products = catalog.get_snapshot().featured
             serializer = self.get_serializer(featured_products, many=True)
             return Response({
                 'featured_products': serializer.data,
-                'total': featured_products.count()
+                'total': len(featured_products)
             })
         except Exception as e:
             return Response(
@@ -684,16 +1079,17 @@ class ProductViewSet(viewsets.ModelViewSet):
         Endpoint: /api/products/{category}/
         """
         try:
+            snapshot = catalog.get_snapshot()
             if category:
-                products = Product.objects.filter(category__iexact=category)
+                products = snapshot.category(category)
             else:
-                products = Product.objects.all()
+                products = snapshot.products
 
             serializer = self.get_serializer(products, many=True)
             return Response({
                 'products': serializer.data,
                 'category': category,
-                'total': products.count()
+                'total': len(products)
             })
         except Exception as e:
             return Response(
@@ -709,25 +1105,21 @@ class CategoryViewSet(viewsets.ViewSet):
     """
     serializer_class = ProductSerializer
 
+    @conditional_catalog
     def list(self, request):
         """
         Devolver todas las categorías disponibles basadas en los choices del modelo,
         indicando cuáles tienen productos actualmente.
+        Los conteos salen de la tabla materializada CatalogCount (core/counts.py).
         """
         category_choices = dict(Product._meta.get_field("category").choices)
-        products_by_category = (
-            Product.objects.values("category")
-            .order_by("category")
-            .annotate(count=Count("id"))
-        )
-
-        counts_map = {item["category"]: item["count"] for item in products_by_category}
+        totals = counts.get_counts()
 
         categories = [
             {
                 "code": code,
                 "name": category_choices.get(code, code),
-                "product_count": counts_map.get(code, 0),
+                "product_count": totals.get(f"category:{code}", 0),
             }
             for code in category_choices.keys()
         ]
@@ -736,12 +1128,17 @@ class CategoryViewSet(viewsets.ViewSet):
             {
                 "categories": categories,
                 "total": len(categories),
+                "total_products": totals.get("total", 0),
+                "featured_products": totals.get("featured", 0),
+                "available_products": totals.get("available", 0),
             }
         )
 
+    @conditional_catalog
     def retrieve(self, request, pk=None):
         """
         Obtener productos por código de categoría (dos caracteres) con paginación opcional.
+        Con ?cursor= se pagina por cursor (orden por id), igual que /api/consulta/.
         """
         if not pk:
             return Response(
@@ -750,8 +1147,25 @@ class CategoryViewSet(viewsets.ViewSet):
             )
 
         code = pk.lower()
-        products_qs = Product.objects.filter(category__iexact=code).order_by("id")
-        total_products = products_qs.count()
+
+        if 'cursor' in request.query_params:
+            try:
+                products, pagination = cursor_page(request, category=code)
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            serializer = ProductSerializer(
+                products, many=True, context=product_serializer_context(request),
+            )
+            return Response(
+                {
+                    "category": code,
+                    "products": serializer.data,
+                    "pagination": pagination,
+                }
+            )
+
+        products_qs = catalog.get_snapshot().category(code)
+        total_products = len(products_qs)
 
         page = request.query_params.get("page", 1)
         page_size = request.query_params.get("page_size", 12)
@@ -779,7 +1193,8 @@ class CategoryViewSet(viewsets.ViewSet):
             page = paginator.num_pages
 
         serializer = ProductSerializer(
-            products_page.object_list, many=True, context={"request": request}
+            products_page.object_list, many=True,
+            context=product_serializer_context(request),
         )
 
         return Response(
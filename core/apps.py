@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registrar los receivers de señales (índice de búsqueda) y la
+        # invalidación del catálogo al migrar
+        from core import signals
+        from django.db.models.signals import post_migrate
+        post_migrate.connect(signals.catalog_migrated, sender=self, dispatch_uid='core.signals.catalog_migrated')
+
+        # PRAGMA de rendimiento en cada conexión SQLite (WAL, busy_timeout...)
+        from django.db.backends.signals import connection_created
+        from core.db import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='core.db.configure_connection')
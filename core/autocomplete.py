@@ -0,0 +1,179 @@
+"""
+Índice de prefijos en memoria para el autocompletado de productos.
+
+Cada worker de gunicorn construye su propio trie con los tokens normalizados
+de los nombres de producto a partir del snapshot del catálogo. Los cambios
+hechos en el propio worker se aplican de forma incremental desde las señales
+de ``core.signals``; los de otros workers se detectan por la versión del
+catálogo y provocan una reconstrucción. Las búsquedas no ejecutan SQL.
+"""
+import threading
+
+from core import catalog
+from core.search import TOKEN_RE, fold_text
+
+
+class _Node:
+    __slots__ = ('children', 'product_ids')
+
+    def __init__(self):
+        self.children = {}
+        self.product_ids = set()
+
+
+class Suggestion:
+    __slots__ = ('id', 'name', 'image', 'folded_name')
+
+    def __init__(self, product):
+        self.id = product.pk
+        self.name = product.name
+        self.image = product.image.url if product.image else None
+        self.folded_name = fold_text(product.name)
+
+
+class PrefixIndex:
+    """
+    Trie de tokens de nombre -> ids de producto.
+    Cada nodo guarda los ids de todos los productos que tienen algún token
+    con ese prefijo, de modo que una búsqueda solo recorre len(prefijo) nodos.
+    """
+
+    def __init__(self, products=(), version=None):
+        self.version = version
+        self._root = _Node()
+        self._entries = {}
+        self._lock = threading.Lock()
+        for product in products:
+            self.add(product)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _tokens(self, folded_name):
+        return set(TOKEN_RE.findall(folded_name))
+
+    def _insert(self, token, product_id):
+        node = self._root
+        for char in token:
+            node = node.children.setdefault(char, _Node())
+            node.product_ids.add(product_id)
+
+    def _discard(self, token, product_id):
+        node = self._root
+        path = []
+        for char in token:
+            child = node.children.get(char)
+            if child is None:
+                break
+            child.product_ids.discard(product_id)
+            path.append((node, char, child))
+            node = child
+        # Podar las ramas que quedaron vacías
+        for parent, char, child in reversed(path):
+            if child.product_ids or child.children:
+                break
+            del parent.children[char]
+
+    def add(self, product):
+        """
+        Inserta o actualiza un producto.
+        """
+        entry = Suggestion(product)
+        with self._lock:
+            previous = self._entries.get(entry.id)
+            if previous is not None:
+                for token in self._tokens(previous.folded_name):
+                    self._discard(token, entry.id)
+            for token in self._tokens(entry.folded_name):
+                self._insert(token, entry.id)
+            self._entries[entry.id] = entry
+
+    def remove(self, product_id):
+        """
+        Elimina un producto del índice (si existe).
+        """
+        with self._lock:
+            previous = self._entries.pop(product_id, None)
+            if previous is None:
+                return
+            for token in self._tokens(previous.folded_name):
+                self._discard(token, product_id)
+
+    def _lookup(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.product_ids
+
+    def suggest(self, query, limit=8):
+        """
+        Retorna hasta `limit` sugerencias cuyo nombre contiene, para cada
+        palabra de la consulta, un token que empieza por esa palabra.
+        """
+        folded_query = fold_text(query).strip()
+        tokens = TOKEN_RE.findall(folded_query)
+        if not tokens:
+            return []
+
+        # Los conjuntos del trie los modifican add/remove desde las señales:
+        # se leen con el lock tomado y solo se ordena fuera de él
+        with self._lock:
+            # Empezar por el conjunto más pequeño para intersectar menos
+            candidate_sets = sorted((self._lookup(token) for token in tokens), key=len)
+            candidates = set(candidate_sets[0])
+            for other in candidate_sets[1:]:
+                candidates &= other
+                if not candidates:
+                    return []
+
+            entries = [self._entries[pk] for pk in candidates if pk in self._entries]
+        # Primero los nombres que empiezan por la consulta, luego los más cortos
+        entries.sort(
+            key=lambda entry: (
+                not entry.folded_name.startswith(folded_query),
+                len(entry.folded_name),
+                entry.folded_name,
+            )
+        )
+        return entries[:limit]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Devuelve el índice del worker actual, reconstruyéndolo si el catálogo
+    cambió en otro worker.
+    """
+    global _index
+    index = _index
+    if index is None or index.version != catalog.get_version():
+        with _index_lock:
+            snapshot = catalog.get_snapshot()
+            index = _index
+            if index is None or index.version != snapshot.version:
+                index = PrefixIndex(snapshot.products, version=snapshot.version)
+                _index = index
+    return index
+
+
+def product_saved(product, previous_version, version):
+    """
+    Aplica un guardado ya confirmado. Si el índice no estaba en la versión
+    anterior (hubo cambios de otros workers) se deja que se reconstruya.
+    """
+    index = _index
+    if index is not None and index.version == previous_version:
+        index.add(product)
+        index.version = version
+
+
+def product_deleted(product_id, previous_version, version):
+    index = _index
+    if index is not None and index.version == previous_version:
+        index.remove(product_id)
+        index.version = version
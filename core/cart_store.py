@@ -0,0 +1,389 @@
+"""
+Almacenamiento del carrito de compras.
+
+``CartApiViewSet`` (y el cálculo de ``in_cart`` del catálogo) leen y escriben
+el carrito a través de un ``CartStore`` configurable con ``settings.CART_STORE``:
+
+- ``SessionCartStore``: el carrito vive en la sesión de Django (comportamiento
+  original). La sesión se marca como modificada y la guarda el middleware.
+- ``SignedCookieCartStore``: el carrito viaja firmado en una cookie; no hay
+  escrituras en la base de datos.
+- ``LocalCartStore``: el carrito se guarda en un archivo SQLite propio en modo
+  WAL, identificado por una cookie firmada, con un buffer de escritura diferida
+  que agrupa los cambios de varias peticiones en una sola transacción.
+
+Junto al carrito cada backend guarda su resumen (totales), que las vistas
+actualizan por diferencias en cada cambio en lugar de recorrer el carrito.
+"""
+import atexit
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core import signing
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseCartStore:
+    """
+    Interfaz común de los backends de carrito.
+    """
+    # Indica si el backend necesita una sesión de Django para funcionar
+    uses_session = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def load(self, request):
+        """
+        Retorna el carrito (dict product_id -> línea) de la petición.
+        """
+        raise NotImplementedError
+
+    def load_summary(self, request):
+        """
+        Retorna el resumen guardado junto al carrito, o None.
+        """
+        raise NotImplementedError
+
+    def save(self, request, cart, summary=None):
+        """
+        Persiste el carrito de la petición (y su resumen, si se indica).
+        """
+        raise NotImplementedError
+
+    def process_response(self, request, response):
+        """
+        Permite al backend modificar la respuesta (p. ej. escribir cookies).
+        """
+        return response
+
+    def purge(self, max_age=None):
+        """
+        Elimina los carritos guardados por el backend que no cambian desde
+        hace `max_age` segundos. Retorna cuántos eliminó.
+        """
+        return 0
+
+    def _cache(self, request, cart, summary=None):
+        # Evita decodificar el carrito más de una vez por petición
+        request._cart_store_cart = cart
+        request._cart_store_summary = summary
+        return cart
+
+    def _cached(self, request):
+        return getattr(request, '_cart_store_cart', None)
+
+    def _unpack(self, payload):
+        """
+        Separa carrito y resumen de un payload {'c': carrito, 's': resumen}.
+        Los payloads antiguos contienen solo el carrito.
+        """
+        if isinstance(payload, dict) and 'c' in payload:
+            cart, summary = payload.get('c'), payload.get('s')
+        else:
+            cart, summary = payload, None
+        if not isinstance(cart, dict):
+            return {}, None
+        return cart, summary if isinstance(summary, dict) else None
+
+    def _pack(self, request):
+        return {
+            'c': self._cached(request) or {},
+            's': getattr(request, '_cart_store_summary', None),
+        }
+
+
+class SessionCartStore(BaseCartStore):
+    """
+    Carrito dentro de la sesión de Django (``request.session['cart']``).
+    """
+    uses_session = True
+
+    def load(self, request):
+        cart = request.session.get('cart', {})
+        if not isinstance(cart, dict):
+            return {}
+        return cart
+
+    def load_summary(self, request):
+        summary = request.session.get('cart_summary')
+        return summary if isinstance(summary, dict) else None
+
+    def save(self, request, cart, summary=None):
+        # SessionMiddleware guarda la sesión al final de la petición; no hace
+        # falta forzar un save() adicional aquí
+        request.session['cart'] = cart
+        if summary is not None:
+            request.session['cart_summary'] = summary
+        else:
+            request.session.pop('cart_summary', None)
+        request.session.modified = True
+
+
+class SignedCookieCartStore(BaseCartStore):
+    """
+    Carrito serializado, comprimido y firmado en una cookie.
+    """
+    salt = 'core.cart_store.SignedCookieCartStore'
+
+    @property
+    def cookie_name(self):
+        return self.options.get('cookie_name', 'condimentos_cart')
+
+    @property
+    def max_age(self):
+        return self.options.get('max_age', settings.SESSION_COOKIE_AGE)
+
+    def load(self, request):
+        cached = self._cached(request)
+        if cached is not None:
+            return cached
+
+        value = request.COOKIES.get(self.cookie_name)
+        payload = None
+        if value:
+            try:
+                payload = signing.loads(value, salt=self.salt, max_age=self.max_age)
+            except signing.BadSignature:
+                payload = None
+        return self._cache(request, *self._unpack(payload))
+
+    def load_summary(self, request):
+        self.load(request)
+        return getattr(request, '_cart_store_summary', None)
+
+    def save(self, request, cart, summary=None):
+        self._cache(request, cart, summary)
+        request._cart_store_dirty = True
+
+    def process_response(self, request, response):
+        if not getattr(request, '_cart_store_dirty', False):
+            return response
+
+        cart = self._cached(request) or {}
+        if not cart:
+            response.delete_cookie(
+                self.cookie_name,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+            return response
+
+        value = signing.dumps(self._pack(request), salt=self.salt, compress=True)
+        if len(value) > 4000:
+            logger.warning(
+                'La cookie del carrito ocupa %s bytes; los navegadores pueden descartarla.',
+                len(value),
+            )
+        response.set_cookie(
+            self.cookie_name,
+            value,
+            max_age=self.max_age,
+            domain=settings.SESSION_COOKIE_DOMAIN,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+        return response
+
+
+class LocalCartStore(BaseCartStore):
+    """
+    Carrito en un archivo SQLite local (modo WAL) con escritura diferida.
+
+    Las escrituras se acumulan en memoria y un hilo las vuelca en una única
+    transacción cada `flush_interval` segundos o cuando hay `max_pending`
+    carritos pendientes. Con `flush_interval = 0` se escribe de inmediato.
+    Mientras un cambio está en el buffer solo lo ve el worker que lo hizo, por
+    lo que conviene un intervalo corto cuando hay varios workers.
+    """
+    salt = 'core.cart_store.LocalCartStore'
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.path = str(options.get('path', settings.DB_DIR / 'carts.sqlite3'))
+        self.cookie_name = options.get('cookie_name', 'condimentos_cart_id')
+        self.max_age = options.get('max_age', settings.SESSION_COOKIE_AGE)
+        self.flush_interval = float(options.get('flush_interval', 0.2))
+        self.max_pending = int(options.get('max_pending', 100))
+
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS carts ('
+                'cart_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS carts_updated_at ON carts(updated_at)')
+        atexit.register(self.flush)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _cart_id(self, request, create=False):
+        cart_id = getattr(request, '_cart_store_id', None)
+        if cart_id:
+            return cart_id
+
+        value = request.COOKIES.get(self.cookie_name)
+        if value:
+            try:
+                cart_id = signing.loads(value, salt=self.salt, max_age=self.max_age)
+            except signing.BadSignature:
+                cart_id = None
+        if not cart_id and create:
+            cart_id = secrets.token_urlsafe(24)
+            request._cart_store_new_id = True
+        if cart_id:
+            request._cart_store_id = cart_id
+        return cart_id
+
+    def load(self, request):
+        cached = self._cached(request)
+        if cached is not None:
+            return cached
+
+        cart_id = self._cart_id(request)
+        if not cart_id:
+            return self._cache(request, {})
+
+        with self._pending_lock:
+            data = self._pending.get(cart_id)
+        if data is None:
+            row = self._connection().execute(
+                'SELECT data FROM carts WHERE cart_id = ?', [cart_id]
+            ).fetchone()
+            data = row[0] if row else None
+
+        try:
+            payload = json.loads(data) if data else None
+        except ValueError:
+            payload = None
+        return self._cache(request, *self._unpack(payload))
+
+    def load_summary(self, request):
+        self.load(request)
+        return getattr(request, '_cart_store_summary', None)
+
+    def save(self, request, cart, summary=None):
+        self._cache(request, cart, summary)
+        cart_id = self._cart_id(request, create=True)
+        data = json.dumps(self._pack(request), separators=(',', ':'))
+
+        if self.flush_interval <= 0:
+            self._write({cart_id: data})
+            return
+
+        with self._pending_lock:
+            self._pending[cart_id] = data
+            pending = len(self._pending)
+        self._ensure_flusher()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def process_response(self, request, response):
+        if getattr(request, '_cart_store_new_id', False):
+            response.set_cookie(
+                self.cookie_name,
+                signing.dumps(request._cart_store_id, salt=self.salt),
+                max_age=self.max_age,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        return response
+
+    def _write(self, batch):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO carts(cart_id, data, updated_at) VALUES (?, ?, ?)',
+                [(cart_id, data, now) for cart_id, data in batch.items()],
+            )
+
+    def flush(self):
+        """
+        Vuelca en una transacción todos los carritos pendientes.
+        """
+        with self._pending_lock:
+            batch, self._pending = self._pending, {}
+        if batch:
+            try:
+                self._write(batch)
+            except sqlite3.Error:
+                logger.exception('No se pudieron guardar %s carritos', len(batch))
+                # Reintentar en el próximo ciclo sin pisar cambios más nuevos
+                with self._pending_lock:
+                    for cart_id, data in batch.items():
+                        self._pending.setdefault(cart_id, data)
+        return len(batch)
+
+    def purge(self, max_age=None, chunk_size=500):
+        """
+        Elimina los carritos sin cambios en `max_age` segundos (por defecto la
+        vigencia de la cookie, después de la cual ya nadie puede leerlos), en
+        lotes de `chunk_size` filas.
+        """
+        cutoff = time.time() - (self.max_age if max_age is None else max_age)
+        conn = self._connection()
+        deleted = 0
+        while True:
+            with conn:
+                count = conn.execute(
+                    'DELETE FROM carts WHERE cart_id IN ('
+                    'SELECT cart_id FROM carts WHERE updated_at < ? LIMIT ?)',
+                    [cutoff, chunk_size],
+                ).rowcount
+            deleted += count
+            if count < chunk_size:
+                return deleted
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._pending_lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name='cart-store-flusher', daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+@lru_cache(maxsize=None)
+def _load_store(path, options):
+    return import_string(path)(**dict(options))
+
+
+def get_cart_store():
+    """
+    Backend de carrito configurado en settings.CART_STORE (una instancia por
+    proceso).
+    """
+    options = getattr(settings, 'CART_STORE_OPTIONS', {}) or {}
+    return _load_store(settings.CART_STORE, tuple(sorted(options.items())))
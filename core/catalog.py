@@ -0,0 +1,189 @@
+"""
+Snapshot inmutable del catálogo, cargado de forma perezosa en cada worker.
+
+Los endpoints de lectura del catálogo sirven siempre los mismos ~cien
+productos, así que cada worker de gunicorn los carga una vez en registros
+compactos (``__slots__``) con índices por id, categoría y destacados.
+
+La invalidación entre procesos usa un contador de versión guardado en un
+archivo (``settings.CATALOG_VERSION_FILE``): las señales de ``Product`` y
+``Collection`` lo incrementan al confirmar la transacción, y cada worker
+compara la versión de su snapshot con la del archivo antes de usarlo. Leer
+la versión es una lectura de archivo, no una consulta SQL.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+def _version_file():
+    return str(settings.CATALOG_VERSION_FILE)
+
+
+def get_version():
+    """
+    Versión actual del catálogo (0 si nunca se ha modificado).
+    """
+    try:
+        with open(_version_file(), 'r') as handle:
+            return int(handle.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def get_last_modified():
+    """
+    Momento (timestamp en segundos) del último cambio del catálogo, o None
+    si nunca se ha modificado.
+    """
+    try:
+        return int(os.stat(_version_file()).st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def bump_version():
+    """
+    Incrementa la versión del catálogo y retorna (anterior, nueva).
+    Se usa el reloj en nanosegundos como piso para que dos procesos que
+    incrementan a la vez no escriban el mismo valor.
+    """
+    previous = get_version()
+    version = max(previous + 1, time.time_ns())
+    path = _version_file()
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as handle:
+        handle.write(str(version))
+    # os.replace es atómico: los lectores ven la versión vieja o la nueva
+    os.replace(tmp_path, path)
+    return previous, version
+
+
+class ImageRef:
+    """
+    Sustituto liviano de ``FieldFile``: expone `name` y `url`, que es lo
+    que usa ``serializers.ImageField`` para representar la imagen.
+    """
+    __slots__ = ('name', 'url')
+
+    def __init__(self, field_file):
+        self.name = field_file.name
+        self.url = field_file.url
+
+    def __bool__(self):
+        return bool(self.name)
+
+
+class ProductRecord:
+    """
+    Copia de solo lectura de un ``Product``. Tiene los mismos atributos que
+    usa ``ProductSerializer``, así que se puede serializar directamente.
+    """
+    __slots__ = (
+        'id', 'name', 'measurement', 'description', 'available',
+        'featured', 'image', 'category', 'image_width', 'image_height',
+        'image_derivatives',
+    )
+
+    def __init__(self, product):
+        self.id = product.id
+        self.name = product.name
+        self.measurement = product.measurement
+        self.description = product.description
+        self.available = product.available
+        self.featured = product.featured
+        self.image = ImageRef(product.image) if product.image else None
+        self.category = product.category
+        self.image_width = product.image_width
+        self.image_height = product.image_height
+        self.image_derivatives = product.image_derivatives or {}
+
+    @property
+    def pk(self):
+        return self.id
+
+
+def category_sort_key(record):
+    return ((record.category or '').lower(), record.id)
+
+
+class CatalogSnapshot:
+    """
+    Productos ordenados por id más los índices usados por los endpoints.
+
+    `orderings` guarda, para cada orden de la paginación por cursor, los
+    registros ordenados y sus claves en una tupla paralela (para bisect).
+    """
+    __slots__ = (
+        'version', 'products', 'by_id', 'by_category', 'featured',
+        'orderings', 'category_keys',
+    )
+
+    def __init__(self, version, products):
+        records = tuple(sorted((ProductRecord(p) for p in products), key=lambda r: r.id))
+        by_category = {}
+        for record in records:
+            by_category.setdefault((record.category or '').lower(), []).append(record)
+
+        self.version = version
+        self.products = records
+        self.by_id = {record.id: record for record in records}
+        self.by_category = {code: tuple(items) for code, items in by_category.items()}
+        self.featured = tuple(record for record in records if record.featured)
+
+        by_category_id = tuple(sorted(records, key=category_sort_key))
+        self.orderings = {
+            'id': (records, tuple((record.id,) for record in records)),
+            'category': (by_category_id, tuple(category_sort_key(r) for r in by_category_id)),
+        }
+        self.category_keys = {
+            code: tuple((record.id,) for record in items)
+            for code, items in self.by_category.items()
+        }
+
+    def get(self, product_id):
+        """
+        Busca un producto por id; acepta ids en texto (p. ej. de la URL).
+        """
+        try:
+            return self.by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def category(self, code):
+        return self.by_category.get((code or '').lower(), ())
+
+    def ordered(self, ordering, category=None):
+        """
+        (registros, claves) en el orden indicado; con `category` solo los de
+        esa categoría, ordenados por id.
+        """
+        if category is not None:
+            code = (category or '').lower()
+            return self.by_category.get(code, ()), self.category_keys.get(code, ())
+        return self.orderings[ordering]
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    Snapshot vigente del worker; se recarga si la versión cambió.
+    """
+    global _snapshot
+    version = get_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                from core.models import Product
+                # La versión se lee antes de las filas: si cambia durante la
+                # carga, el snapshot queda desactualizado y se recarga luego.
+                snapshot = CatalogSnapshot(version, Product.objects.all())
+                _snapshot = snapshot
+    return snapshot
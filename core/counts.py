@@ -0,0 +1,99 @@
+"""
+Conteos materializados del catálogo (tabla ``CatalogCount``).
+
+Cada producto suma 1 a 'total', a 'category:<código>' y, según sus flags, a
+'featured' y 'available'. Las señales de ``Product`` aplican solo la
+diferencia entre el estado anterior y el nuevo, así la navegación por
+categorías no necesita agregados ni cargar el snapshot del catálogo.
+Los cambios hechos con ``QuerySet.update()`` o SQL directo no pasan por las
+señales; para corregir esa deriva está ``manage.py rebuild_catalog_counts``.
+"""
+import threading
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from core import catalog
+
+COUNT_FIELDS = ('category', 'featured', 'available')
+
+
+def product_keys(category, featured, available):
+    """
+    Claves de CatalogCount a las que aporta un producto.
+    """
+    keys = ['total', f"category:{(category or '').lower()}"]
+    if featured:
+        keys.append('featured')
+    if available:
+        keys.append('available')
+    return keys
+
+
+def apply_delta(old_keys, new_keys, using='default'):
+    """
+    Resta 1 en `old_keys` y suma 1 en `new_keys` (las claves comunes se
+    cancelan). Crea las filas que falten.
+    """
+    from core.models import CatalogCount
+
+    delta = Counter(new_keys)
+    delta.subtract(Counter(old_keys))
+    changes = {key: value for key, value in delta.items() if value}
+    if not changes:
+        return
+
+    counts = CatalogCount.objects.using(using)
+    counts.bulk_create(
+        [CatalogCount(key=key, count=0) for key in changes], ignore_conflicts=True
+    )
+    for key, value in changes.items():
+        counts.filter(key=key).update(count=F('count') + value)
+
+
+def rebuild_counts(using='default'):
+    """
+    Recalcula todos los conteos desde Product. Retorna {clave: conteo}.
+    """
+    from core.models import CatalogCount, Product
+
+    products = Product.objects.using(using)
+    totals = products.aggregate(
+        total=Count('id'),
+        featured=Count('id', filter=Q(featured=True)),
+        available=Count('id', filter=Q(available=True)),
+    )
+    for row in products.values('category').annotate(n=Count('id')):
+        key = f"category:{(row['category'] or '').lower()}"
+        totals[key] = totals.get(key, 0) + row['n']
+
+    with transaction.atomic(using=using):
+        CatalogCount.objects.using(using).all().delete()
+        CatalogCount.objects.using(using).bulk_create(
+            [CatalogCount(key=key, count=count) for key, count in totals.items()]
+        )
+    return totals
+
+
+_cache = (None, {})
+_cache_lock = threading.Lock()
+
+
+def get_counts():
+    """
+    {clave: conteo} de CatalogCount, cacheado en el worker por versión del
+    catálogo (las señales que cambian los conteos también la incrementan).
+    """
+    global _cache
+    version = catalog.get_version()
+    cached_version, counts = _cache
+    if cached_version != version:
+        from core.models import CatalogCount
+
+        with _cache_lock:
+            cached_version, counts = _cache
+            if cached_version != version:
+                counts = dict(CatalogCount.objects.values_list('key', 'count'))
+                _cache = (version, counts)
+    return counts
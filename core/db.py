@@ -0,0 +1,74 @@
+"""
+Configuración de las conexiones SQLite.
+
+Cada conexión nueva (señal ``connection_created``) ejecuta los PRAGMA de
+``settings.SQLITE_PRAGMAS``:
+
+- ``journal_mode=wal``: los lectores no bloquean al escritor ni al revés
+  (con tres workers de gunicorn, las escrituras de sesión/carrito ya no
+  detienen las lecturas del catálogo).
+- ``synchronous=normal``: en WAL no se pierde consistencia, solo las últimas
+  transacciones ante un corte de energía, y evita un fsync por commit.
+- ``busy_timeout``: milisegundos que una escritura espera el lock antes de
+  fallar con "database is locked".
+- ``cache_size``, ``mmap_size`` y ``temp_store``: caché de páginas,
+  lectura por mmap y tablas temporales en memoria.
+"""
+from django.conf import settings
+
+# PRAGMA admitidos y cómo se valida su valor (vienen de variables de entorno)
+PRAGMA_VALUES = {
+    'journal_mode': ('delete', 'truncate', 'persist', 'memory', 'wal', 'off'),
+    'synchronous': ('off', 'normal', 'full', 'extra'),
+    'temp_store': ('default', 'file', 'memory'),
+    'busy_timeout': int,
+    'cache_size': int,
+    'mmap_size': int,
+}
+
+
+def pragma_statements(pragmas):
+    """
+    Sentencias PRAGMA para `pragmas` ({nombre: valor}); los valores vacíos
+    se omiten. Lanza ValueError con nombres o valores no admitidos.
+    """
+    statements = []
+    # busy_timeout primero: cambiar journal_mode también espera el lock
+    for name, value in sorted(pragmas.items(), key=lambda item: item[0] != 'busy_timeout'):
+        if value in (None, ''):
+            continue
+        allowed = PRAGMA_VALUES.get(name)
+        if allowed is None:
+            raise ValueError(f'PRAGMA no admitido: {name}')
+        if allowed is int:
+            value = int(value)
+        else:
+            value = str(value).lower()
+            if value not in allowed:
+                raise ValueError(f'Valor no admitido para PRAGMA {name}: {value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Receiver de ``connection_created``: aplica SQLITE_PRAGMAS a las
+    conexiones SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if is_read_only(connection.settings_dict):
+        # El modo de journal se guarda en el archivo: solo lo cambia quien escribe
+        pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+
+
+def is_read_only(settings_dict):
+    """
+    Indica si la base se abre como URI de solo lectura (mode=ro/immutable=1).
+    """
+    name = str(settings_dict.get('NAME') or '')
+    return name.startswith('file:') and ('mode=ro' in name or 'immutable=1' in name)
@@ -0,0 +1,181 @@
+"""
+Búsqueda tolerante a errores de tipeo con un índice de trigramas.
+
+Se indexan las palabras (normalizadas con Unidecode) de los nombres y
+descripciones de los productos. Cada palabra se descompone en trigramas al
+estilo de pg_trgm ("  canela " -> "  c", " ca", "can", ...) y las listas de
+postings trigrama -> palabras permiten que una consulta solo visite las
+palabras que comparten al menos un trigrama con ella. Los candidatos se
+puntúan por similitud de trigramas y se validan con una distancia de edición
+acotada.
+
+El índice se construye una vez por worker desde el snapshot del catálogo y
+se reconstruye cuando cambia la versión del catálogo.
+"""
+import threading
+from collections import defaultdict
+
+from core import catalog
+from core.search import TOKEN_RE, fold_text
+
+# Similitud mínima (Jaccard de trigramas) para considerar una palabra
+MIN_SIMILARITY = 0.2
+
+# Las coincidencias en el nombre pesan más que en la descripción
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def trigrams(word):
+    """
+    Trigramas de una palabra con el relleno usado por pg_trgm.
+    """
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edit_distance(word):
+    """
+    Distancia de edición tolerada según la longitud de la palabra.
+    """
+    if len(word) <= 4:
+        return 1
+    if len(word) <= 8:
+        return 2
+    return 3
+
+
+def bounded_levenshtein(a, b, limit):
+    """
+    Distancia de Levenshtein entre `a` y `b`, o `limit + 1` si la supera.
+    Corta en cuanto todas las celdas de una fila exceden el límite.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            cost = 0 if char_a == char_b else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    Índice invertido trigrama -> palabras -> productos.
+    """
+
+    def __init__(self, products=(), version=None):
+        self.version = version
+        self._words = []                         # word_id -> palabra
+        self._word_ids = {}                      # palabra -> word_id
+        self._word_trigram_count = []            # word_id -> nº de trigramas
+        self._postings = defaultdict(list)       # trigrama -> [word_id]
+        self._word_products = defaultdict(dict)  # word_id -> {product_id: peso}
+        for product in products:
+            self._add_text(product.pk, product.name, NAME_WEIGHT)
+            self._add_text(product.pk, product.description, DESCRIPTION_WEIGHT)
+
+    def _word_id(self, word):
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = len(self._words)
+            self._word_ids[word] = word_id
+            self._words.append(word)
+            grams = trigrams(word)
+            self._word_trigram_count.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(word_id)
+        return word_id
+
+    def _add_text(self, product_id, text, weight):
+        for word in set(TOKEN_RE.findall(fold_text(text))):
+            if len(word) < 2:
+                continue
+            products = self._word_products[self._word_id(word)]
+            products[product_id] = max(products.get(product_id, 0), weight)
+
+    def _similar_words(self, word):
+        """
+        Palabras del índice parecidas a `word`: [(word_id, similitud)].
+        """
+        grams = trigrams(word)
+        shared = defaultdict(int)
+        for gram in grams:
+            for word_id in self._postings.get(gram, ()):
+                shared[word_id] += 1
+
+        limit = max_edit_distance(word)
+        matches = []
+        for word_id, common in shared.items():
+            similarity = common / (len(grams) + self._word_trigram_count[word_id] - common)
+            if similarity < MIN_SIMILARITY:
+                continue
+            candidate = self._words[word_id]
+            if candidate.startswith(word):
+                # Palabra incompleta ("canel" -> "canela"): cuenta como exacta
+                matches.append((word_id, max(similarity, 0.9)))
+                continue
+            distance = bounded_levenshtein(word, candidate, limit)
+            if distance <= limit:
+                matches.append((word_id, similarity * (1 - distance / (limit + 1))))
+        return matches
+
+    def search(self, query):
+        """
+        Retorna los ids de producto ordenados por relevancia.
+        Cada palabra de la consulta debe parecerse a alguna palabra del producto.
+        """
+        words = [word for word in TOKEN_RE.findall(fold_text(query)) if len(word) >= 2]
+        if not words:
+            return []
+
+        scores = None
+        for word in words:
+            word_scores = defaultdict(float)
+            for word_id, similarity in self._similar_words(word):
+                for product_id, weight in self._word_products[word_id].items():
+                    score = similarity * weight
+                    if score > word_scores[product_id]:
+                        word_scores[product_id] = score
+
+            if scores is None:
+                scores = dict(word_scores)
+            else:
+                scores = {
+                    product_id: score + word_scores[product_id]
+                    for product_id, score in scores.items()
+                    if product_id in word_scores
+                }
+            if not scores:
+                return []
+
+        return sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Devuelve el índice del worker actual, reconstruyéndolo si el catálogo
+    cambió desde la última construcción.
+    """
+    global _index
+    snapshot = catalog.get_snapshot()
+    index = _index
+    if index is None or index.version != snapshot.version:
+        with _index_lock:
+            index = _index
+            if index is None or index.version != snapshot.version:
+                index = TrigramIndex(snapshot.products, version=snapshot.version)
+                _index = index
+    return index
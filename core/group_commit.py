@@ -0,0 +1,199 @@
+"""
+Escritura agrupada ("group commit") de sesiones.
+
+Con ``settings.SESSION_GROUP_COMMIT`` activo, ``core.session_backend`` no
+guarda cada sesión en su propia transacción: la encola en el escritor de su
+base de datos (uno por alias en cada proceso), un hilo que junta las sesiones que llegan de los hilos de las
+peticiones y las guarda en una sola transacción (un solo commit/fsync por
+lote). Un lote toma las escrituras que esperan mientras se confirma el
+anterior y se cierra al llegar a ``SESSION_GROUP_COMMIT_MAX_BATCH``
+escrituras o al pasar ``SESSION_GROUP_COMMIT_MAX_WAIT`` milisegundos desde
+la primera (la espera solo se hace con escrituras concurrentes).
+
+Cada petición espera a que el commit de su lote termine antes de seguir,
+así la respuesta sale con la sesión ya guardada. Si el lote falla se
+reintenta escritura por escritura, para que el error lo reciba solo la
+petición que lo causó.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.models import Session
+from django.db import DatabaseError, connections, transaction
+
+from core.models import CartSession
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT = 2  # milisegundos
+
+# Escritores del proceso por alias de base de datos
+_writers = {}
+_writer_lock = threading.Lock()
+
+
+class SessionWrite:
+    """
+    Una sesión por guardar. `cart_lines` es None si la marca de carrito no
+    cambia, 0 para eliminarla o el número de líneas para guardarla.
+    """
+    __slots__ = ('session_key', 'session_data', 'expire_date', 'must_create',
+                 'cart_lines', 'error', 'done')
+
+    def __init__(self, session_key, session_data, expire_date, must_create, cart_lines):
+        self.session_key = session_key
+        self.session_data = session_data
+        self.expire_date = expire_date
+        self.must_create = must_create
+        self.cart_lines = cart_lines
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommitWriter:
+
+    def __init__(self, using, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT):
+        self.using = using
+        self.max_batch = max_batch
+        self.max_wait = max_wait / 1000
+        # Lotes y escrituras confirmadas (para los benchmarks)
+        self.batches = 0
+        self.writes = 0
+        self._last_batch = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='session-group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        """
+        Encola `write` y espera su commit. Lanza CreateError/UpdateError como
+        el motor de sesiones de Django, o el error de la base de datos.
+        """
+        self._queue.put(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            # Solo se espera a más escrituras si el lote anterior tuvo varias:
+            # sin concurrencia, una sesión sola no paga la espera
+            deadline = time.monotonic() + (self.max_wait if self._last_batch > 1 else 0)
+            while len(batch) < self.max_batch:
+                try:
+                    # Lo que ya está en cola entra sin esperar
+                    write = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if write is None:
+                    self._queue.put(None)
+                    break
+                batch.append(write)
+            try:
+                self._commit(batch)
+            except Exception as exc:
+                # Nunca dejar peticiones esperando
+                logger.exception('Error en el escritor de sesiones')
+                for write in batch:
+                    write.error = write.error or exc
+                    write.done.set()
+        connections[self.using].close()
+
+    def _commit(self, batch):
+        connections[self.using].close_if_unusable_or_obsolete()
+        try:
+            with transaction.atomic(using=self.using):
+                for write in batch:
+                    write.error = self._apply(write)
+        except DatabaseError:
+            logger.exception('Falló un lote de %s sesiones; se guardan por separado', len(batch))
+            for write in batch:
+                try:
+                    with transaction.atomic(using=self.using):
+                        write.error = self._apply(write)
+                except DatabaseError as exc:
+                    write.error = exc
+        self.batches += 1
+        self.writes += len(batch)
+        self._last_batch = len(batch)
+        for write in batch:
+            write.done.set()
+
+    def _apply(self, write):
+        """
+        Ejecuta `write` dentro de la transacción del lote. Retorna el error
+        para la petición (sin lanzarlo, para no abortar el lote) o None.
+        """
+        connection = connections[self.using]
+        if write.must_create:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {Session._meta.db_table} '
+                    '(session_key, session_data, expire_date) VALUES (%s, %s, %s) '
+                    'ON CONFLICT (session_key) DO NOTHING',
+                    [
+                        write.session_key,
+                        write.session_data,
+                        connection.ops.adapt_datetimefield_value(write.expire_date),
+                    ],
+                )
+                if cursor.rowcount != 1:
+                    return CreateError()
+        else:
+            updated = Session.objects.using(self.using).filter(
+                session_key=write.session_key
+            ).update(session_data=write.session_data, expire_date=write.expire_date)
+            if not updated:
+                return UpdateError()
+
+        if write.cart_lines:
+            CartSession.objects.using(self.using).bulk_create(
+                [CartSession(session_key=write.session_key, items=write.cart_lines)],
+                update_conflicts=True,
+                unique_fields=['session_key'],
+                update_fields=['items', 'updated_at'],
+            )
+        elif write.cart_lines == 0:
+            CartSession.objects.using(self.using).filter(session_key=write.session_key).delete()
+        return None
+
+
+def get_writer(using):
+    """
+    Escritor del proceso para la base `using` (se crea con el primer
+    guardado en ella).
+    """
+    with _writer_lock:
+        writer = _writers.get(using)
+        if writer is None:
+            writer = _writers[using] = GroupCommitWriter(
+                using,
+                max_batch=getattr(settings, 'SESSION_GROUP_COMMIT_MAX_BATCH', DEFAULT_MAX_BATCH),
+                max_wait=getattr(settings, 'SESSION_GROUP_COMMIT_MAX_WAIT', DEFAULT_MAX_WAIT),
+            )
+        return writer
+
+
+def stop_writer(using=None):
+    """
+    Detiene el escritor de `using`, o todos sin `using` (lo usan los
+    benchmarks para empezar cada medición con contadores nuevos).
+    """
+    with _writer_lock:
+        aliases = list(_writers) if using is None else [using]
+        writers = [_writers.pop(alias) for alias in aliases if alias in _writers]
+    for writer in writers:
+        writer.stop()
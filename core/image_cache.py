@@ -0,0 +1,211 @@
+"""
+Redimensionado de imágenes bajo demanda con caché en disco.
+
+``/images/<ancho>x<alto>/<ruta>`` devuelve la imagen de ``MEDIA_ROOT``
+reducida para caber en ese recuadro (sin agrandarla ni recortarla; 0 deja
+esa dimensión libre). La primera petición la genera con Pillow y la guarda
+en ``settings.IMAGE_CACHE_DIR``; las siguientes se sirven desde el disco.
+
+- La caché tiene un tamaño máximo (``IMAGE_CACHE_MAX_BYTES``): al superarlo
+  se eliminan los archivos usados hace más tiempo (LRU por mtime, que se
+  actualiza al servirlos).
+- Las generaciones concurrentes de la misma variante se hacen una sola vez
+  ("single flight"): un lock de archivo (``fcntl.flock``) coordina los hilos
+  y los procesos de gunicorn; quien espera encuentra el archivo ya generado.
+  Los archivos ``.lock`` no se eliminan: si se borraran, un proceso que
+  abre la ruta después tomaría el lock sobre un archivo nuevo mientras otro
+  aún espera sobre el anterior, y ambos generarían la variante.
+- Los tamaños aceptados forman una grilla (múltiplos de
+  ``IMAGE_RESIZE_STEP`` hasta ``IMAGE_RESIZE_MAX_DIMENSION``, ver
+  `size_allowed`), así la cantidad de variantes está acotada.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Formatos de salida según la extensión del original
+OUTPUT_FORMATS = {
+    '.jpg': ('JPEG', {'quality': 85, 'optimize': True}),
+    '.jpeg': ('JPEG', {'quality': 85, 'optimize': True}),
+    '.png': ('PNG', {'optimize': True}),
+    '.webp': ('WEBP', {'quality': 82}),
+    '.gif': ('PNG', {'optimize': True}),
+}
+# Segundos mínimos entre actualizaciones del mtime de un archivo servido
+TOUCH_INTERVAL = 60
+# Al desalojar se baja hasta esta fracción del máximo
+EVICT_TARGET = 0.9
+
+_size_lock = threading.Lock()
+_cache_bytes = None
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def cache_dir():
+    return str(settings.IMAGE_CACHE_DIR)
+
+
+def variant_path(source, width, height):
+    """
+    Archivo de caché de la variante (el mtime del original forma parte de la
+    clave, así un original reemplazado genera variantes nuevas).
+    """
+    ext = os.path.splitext(source)[1].lower()
+    if ext == '.gif':
+        ext = '.png'
+    key = f"{source}:{os.path.getmtime(source)}:{width}x{height}"
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(cache_dir(), digest[:2], f"{digest}{ext}")
+
+
+def _touch(path):
+    try:
+        if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL:
+            os.utime(path)
+    except OSError:
+        pass
+
+
+class _SingleFlight:
+    """
+    Lock exclusivo por variante: entre hilos con un threading.Lock y entre
+    procesos con flock sobre `<variante>.lock` (que se conserva).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        with _local_locks_guard:
+            self.local = _local_locks.setdefault(self.path, threading.Lock())
+        self.local.acquire()
+        self.handle = None
+        if fcntl is not None:
+            self.handle = open(f"{self.path}.lock", 'w')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+        self.local.release()
+        with _local_locks_guard:
+            if not self.local.locked():
+                _local_locks.pop(self.path, None)
+
+
+def _render(source, target, width, height):
+    ext = os.path.splitext(source)[1].lower()
+    pil_format, options = OUTPUT_FORMATS[ext]
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        box = (width or image.width, height or image.height)
+        # Solo se reduce: nunca se agranda el original
+        box = (min(box[0], image.width), min(box[1], image.height))
+        image = ImageOps.contain(image, box, Image.LANCZOS)
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp, pil_format, **options)
+    os.replace(tmp, target)
+    return os.path.getsize(target)
+
+
+def size_allowed(width, height):
+    """
+    Indica si width x height está en la grilla de tamaños aceptados: cada
+    dimensión es 0 o un múltiplo de IMAGE_RESIZE_STEP no mayor que
+    IMAGE_RESIZE_MAX_DIMENSION, y al menos una no es 0.
+    """
+    step = settings.IMAGE_RESIZE_STEP
+    return bool(width or height) and all(
+        0 <= value <= settings.IMAGE_RESIZE_MAX_DIMENSION and value % step == 0
+        for value in (width, height)
+    )
+
+
+def get_resized(source, width, height):
+    """
+    Ruta del archivo en caché con `source` redimensionado a width x height,
+    generándolo si hace falta.
+    """
+    target = variant_path(source, width, height)
+    if os.path.exists(target):
+        _touch(target)
+        return target
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with _SingleFlight(target):
+        # Otro hilo/proceso pudo generarla mientras se esperaba el lock
+        if os.path.exists(target):
+            return target
+        size = _render(source, target, width, height)
+    _account(size)
+    return target
+
+
+def _scan():
+    files = []
+    for root, _, names in os.walk(cache_dir()):
+        for name in names:
+            if name.endswith(('.lock', '.tmp')):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def _account(size):
+    """
+    Suma `size` al tamaño de la caché y desaloja si supera el máximo.
+    El total se lleva por proceso y se corrige con un recorrido del
+    directorio al desalojar (otros procesos también escriben).
+    """
+    global _cache_bytes
+    with _size_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(item[1] for item in _scan())
+        else:
+            _cache_bytes += size
+        if _cache_bytes > settings.IMAGE_CACHE_MAX_BYTES:
+            _cache_bytes = evict(settings.IMAGE_CACHE_MAX_BYTES * EVICT_TARGET)
+
+
+def evict(limit):
+    """
+    Elimina los archivos menos usados hasta que la caché ocupe <= `limit`
+    bytes. Retorna el tamaño resultante.
+    """
+    files = sorted(_scan())
+    total = sum(item[1] for item in files)
+    removed = 0
+    for _, size, path in files:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        logger.info('Caché de imágenes: %s archivos eliminados, %s bytes en uso', removed, total)
+    return total
@@ -0,0 +1,131 @@
+"""
+Derivados responsivos de ``Product.image``.
+
+Por cada imagen original se generan versiones de ancho fijo
+(``DERIVATIVE_WIDTHS``) en WebP y JPEG dentro de ``MEDIA_ROOT/derivatives``.
+Los anchos mayores que el original no se generan (no se agranda). El
+resultado se guarda en ``Product.image_derivatives`` con la forma::
+
+    {"320": {"width": 320, "height": 240,
+             "webp": "derivatives/foto-320.webp",
+             "jpeg": "derivatives/foto-320.jpg"}, ...}
+
+``build_derivatives`` solo usa Pillow y el sistema de archivos, para poder
+ejecutarla en procesos aparte (``manage.py generate_image_derivatives``).
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+DERIVATIVES_DIR = 'derivatives'
+FORMATS = {
+    'webp': ('WEBP', '.webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Errores de una imagen que no se puede procesar: archivo faltante o
+# ilegible, formato no reconocido o dañado, o demasiados píxeles
+IMAGE_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+
+def derivative_name(name, width, fmt):
+    """
+    Ruta (relativa a MEDIA_ROOT) del derivado de `name` con ese ancho.
+    """
+    stem = os.path.splitext(name)[0].replace(os.sep, '_')
+    return f"{DERIVATIVES_DIR}/{stem}-{width}{FORMATS[fmt][1]}"
+
+
+def build_derivatives(name, media_root, force=False):
+    """
+    Genera los derivados de la imagen `name` (relativa a `media_root`).
+    Retorna (ancho, alto, mapa de derivados). Los derivados ya existentes y
+    más nuevos que el original se reutilizan salvo con `force`.
+    """
+    source = os.path.join(media_root, name)
+    source_mtime = os.path.getmtime(source)
+    os.makedirs(os.path.join(media_root, DERIVATIVES_DIR), exist_ok=True)
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        derivatives = {}
+        for target in DERIVATIVE_WIDTHS:
+            if target > width and target != DERIVATIVE_WIDTHS[0]:
+                continue
+            target = min(target, width)
+            target_height = max(1, round(height * target / width))
+            entry = {'width': target, 'height': target_height}
+            resized = None
+
+            for fmt, (pil_format, _, save_options) in FORMATS.items():
+                relative = derivative_name(name, target, fmt)
+                path = os.path.join(media_root, relative)
+                entry[fmt] = relative
+                if not force and os.path.exists(path) and os.path.getmtime(path) >= source_mtime:
+                    continue
+                if resized is None:
+                    resized = image.resize((target, target_height), Image.LANCZOS)
+                output = resized
+                if pil_format == 'JPEG' and output.mode == 'RGBA':
+                    # JPEG no tiene transparencia: fondo blanco
+                    background = Image.new('RGB', output.size, (255, 255, 255))
+                    background.paste(output, mask=output.getchannel('A'))
+                    output = background
+                tmp_path = f"{path}.tmp"
+                output.save(tmp_path, pil_format, **save_options)
+                os.replace(tmp_path, path)
+
+            derivatives[str(target)] = entry
+
+    return width, height, derivatives
+
+
+def update_product_derivatives(product, force=False):
+    """
+    Genera los derivados de la imagen de `product` y los guarda con
+    QuerySet.update() (sin volver a disparar las señales de guardado).
+    Si la imagen no se puede procesar se registra y el producto queda sin
+    derivados.
+    """
+    from core.models import Product
+
+    if not product.image:
+        fields = {'image_width': None, 'image_height': None, 'image_derivatives': {}}
+    else:
+        try:
+            width, height, derivatives = build_derivatives(
+                product.image.name, settings.MEDIA_ROOT, force=force
+            )
+        except FileNotFoundError:
+            logger.warning('No existe la imagen %s; no se generan derivados', product.image.name)
+            return
+        except IMAGE_ERRORS:
+            logger.exception('No se pudieron generar los derivados de %s', product.image.name)
+            return
+        fields = {'image_width': width, 'image_height': height, 'image_derivatives': derivatives}
+
+    Product.objects.filter(pk=product.pk).update(**fields)
+    for field, value in fields.items():
+        setattr(product, field, value)
+
+
+def srcset(derivatives):
+    """
+    Mapa {formato: {ancho: url}} listo para armar atributos srcset.
+    """
+    result = {}
+    for width, entry in sorted((derivatives or {}).items(), key=lambda item: int(item[0])):
+        for fmt in FORMATS:
+            if entry.get(fmt):
+                result.setdefault(fmt, {})[width] = default_storage.url(entry[fmt])
+    return result
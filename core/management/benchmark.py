@@ -0,0 +1,29 @@
+"""
+Utilidades de los comandos de benchmark (``bench_cart_store``,
+``stress_cart_sessions``). Viven junto a los comandos para que el código
+de la aplicación no importe las herramientas de pruebas de Django.
+"""
+import os
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def temporary_databases(directory):
+    """
+    Bases de datos de prueba para todos los alias (las SQLite como archivos
+    en `directory`, no en memoria) mientras dura el bloque. La usan los
+    comandos de benchmark para no escribir en las bases reales.
+    """
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        test = settings_dict.setdefault('TEST', {})
+        if connections[alias].vendor == 'sqlite' and not test.get('MIRROR'):
+            test['NAME'] = os.path.join(directory, f'{alias}.sqlite3')
+    old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections))
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+
+from core.management.benchmark import temporary_databases
+
+BACKENDS = {
+    'session': 'core.cart_store.SessionCartStore',
+    'cookie': 'core.cart_store.SignedCookieCartStore',
+    'local': 'core.cart_store.LocalCartStore',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el throughput de los backends de carrito simulando clientes '
+        'concurrentes que agregan productos. Usa una base de datos temporal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=300,
+                            help='Operaciones por hilo (por defecto 300).')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Hilos concurrentes (por defecto 4).')
+        parser.add_argument('--clients', type=int, default=20,
+                            help='Clientes (cookies) distintos por hilo.')
+        parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS),
+                            default=sorted(BACKENDS))
+
+    def handle(self, *args, **options):
+        tmpdir = tempfile.mkdtemp(prefix='bench-cart-')
+        # Bases temporales en archivos (no :memory:) para medir también el
+        # fsync; incluye la de sesiones (core/routers.py)
+        try:
+            with temporary_databases(tmpdir):
+                for name in options['backends']:
+                    store_options = {}
+                    if name == 'local':
+                        store_options['path'] = os.path.join(tmpdir, 'carts.sqlite3')
+                    store = import_string(BACKENDS[name])(**store_options)
+                    elapsed, done, errors = self._run(store, options)
+                    self.stdout.write(
+                        f'{name:8s} {done:6d} ops  {elapsed:7.2f}s  '
+                        f'{done / elapsed if elapsed else 0:9.1f} ops/s  errores={errors}'
+                    )
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _run(self, store, options):
+        engine = import_module(settings.SESSION_ENGINE)
+        factory = RequestFactory()
+        counters = {'done': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(thread_id):
+            clients = [{} for _ in range(options['clients'])]
+            done = errors = 0
+            for i in range(options['operations']):
+                cookies = clients[i % len(clients)]
+                request = factory.post('/api/cart/')
+                request.COOKIES.update(cookies)
+                request.session = engine.SessionStore(
+                    cookies.get(settings.SESSION_COOKIE_NAME)
+                )
+                try:
+                    cart = store.load(request)
+                    cart[str(i % 50)] = [i, 'un']
+                    store.save(request, cart)
+                    response = store.process_response(request, HttpResponse())
+                    if store.uses_session:
+                        # Lo que haría SessionMiddleware al final de la petición
+                        request.session.save()
+                        cookies[settings.SESSION_COOKIE_NAME] = request.session.session_key
+                    for key, morsel in response.cookies.items():
+                        cookies[key] = morsel.value
+                    done += 1
+                except Exception:
+                    errors += 1
+            connections.close_all()
+            with lock:
+                counters['done'] += done
+                counters['errors'] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Lo que quedó en el buffer de escritura diferida también cuenta
+        if hasattr(store, 'flush'):
+            store.flush()
+        return time.perf_counter() - start, counters['done'], counters['errors']
@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.db import pragma_statements
+
+# Configuración previa: modo rollback journal, fsync completo, el timeout por
+# defecto del módulo sqlite3 (5 s) y una conexión nueva por petición
+BASELINE_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full', 'busy_timeout': 5000}
+
+READ_SQL = (
+    'SELECT id, name, category, featured, available, image '
+    'FROM core_product WHERE category = ? ORDER BY id'
+)
+SESSION_TABLE_SQL = (
+    'CREATE TABLE IF NOT EXISTS django_session (session_key varchar(40) NOT NULL '
+    'PRIMARY KEY, session_data text NOT NULL, expire_date datetime NOT NULL)'
+)
+WRITE_SQL = (
+    'INSERT OR REPLACE INTO django_session (session_key, session_data, expire_date) '
+    'VALUES (?, ?, ?)'
+)
+
+
+def _profiles():
+    return {
+        'baseline': {'pragmas': BASELINE_PRAGMAS, 'persistent': False},
+        'tuned': {'pragmas': settings.SQLITE_PRAGMAS, 'persistent': True},
+        # Como tuned, con las sesiones en su propio archivo (core/routers.py)
+        'split': {'pragmas': settings.SQLITE_PRAGMAS, 'persistent': True, 'split': True},
+    }
+
+
+def _connect(path, statements):
+    conn = sqlite3.connect(path, isolation_level=None)
+    for statement in statements:
+        conn.execute(statement)
+    return conn
+
+
+def _worker(args):
+    """
+    Proceso lector o escritor: ejecuta "peticiones" hasta `deadline` y
+    retorna (rol, latencias en ms, errores de lock).
+    """
+    role, path, statements, persistent, deadline, categories = args
+    latencies, errors = [], 0
+    conn = _connect(path, statements) if persistent else None
+    expire = (datetime.utcnow() + timedelta(days=14)).isoformat(' ')
+    payload = 'x' * 400
+    i = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            # Sin conexiones persistentes cada petición abre la suya
+            current = conn or _connect(path, statements)
+            if role == 'read':
+                current.execute(READ_SQL, (categories[i % len(categories)],)).fetchall()
+            else:
+                current.execute(WRITE_SQL, (f'bench-{os.getpid()}-{i % 50}', payload, expire))
+            if conn is None:
+                current.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except sqlite3.OperationalError as exc:
+            if 'locked' not in str(exc) and 'busy' not in str(exc):
+                raise
+            errors += 1
+        i += 1
+    if conn is not None:
+        conn.close()
+    return role, latencies, errors
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la contención lectura/escritura de SQLite con varios procesos '
+        '(como los workers de gunicorn) sobre una copia de la base de datos, '
+        'con la configuración previa (baseline), con SQLITE_PRAGMAS y '
+        'conexiones persistentes (tuned) y además con las sesiones en otro '
+        'archivo (split).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=3,
+                            help='Procesos lectores (por defecto 3).')
+        parser.add_argument('--writers', type=int, default=3,
+                            help='Procesos escritores (por defecto 3).')
+        parser.add_argument('--duration', type=float, default=5,
+                            help='Segundos por configuración (por defecto 5).')
+        parser.add_argument('--profiles', nargs='+', choices=['baseline', 'tuned', 'split'],
+                            default=['baseline', 'tuned', 'split'])
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este benchmark solo aplica a SQLite.')
+        categories = [
+            row[0] for row in connection.cursor().execute(
+                'SELECT DISTINCT category FROM core_product'
+            ).fetchall()
+        ] or ['co']
+
+        tmpdir = tempfile.mkdtemp(prefix='bench-sqlite-')
+        try:
+            profiles = _profiles()
+            for name in options['profiles']:
+                profile = profiles[name]
+                path = os.path.join(tmpdir, f'{name}-{uuid.uuid4().hex}.sqlite3')
+                # Copia consistente de la base actual (el modo de journal
+                # queda guardado en el archivo, por eso una copia por perfil)
+                with sqlite3.connect(path) as target:
+                    connection.ensure_connection()
+                    connection.connection.backup(target)
+                target.close()
+                statements = pragma_statements(profile['pragmas'])
+                write_path = path
+                if profile.get('split'):
+                    write_path = os.path.join(tmpdir, f'{name}-sessions.sqlite3')
+                for db_path in {path, write_path}:
+                    with _connect(db_path, statements) as conn:
+                        conn.execute(SESSION_TABLE_SQL)
+                    conn.close()
+
+                deadline = time.time() + options['duration']
+                jobs = (
+                    [('read', path, statements, profile['persistent'], deadline, categories)]
+                    * options['readers']
+                    + [('write', write_path, statements, profile['persistent'], deadline, categories)]
+                    * options['writers']
+                )
+                with multiprocessing.Pool(len(jobs)) as pool:
+                    results = pool.map(_worker, jobs)
+                self._report(name, results, options['duration'])
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _report(self, name, results, duration):
+        for role in ('read', 'write'):
+            latencies = [value for r, values, _ in results if r == role for value in values]
+            errors = sum(e for r, _, e in results if r == role)
+            self.stdout.write(
+                f'{name:8s} {role:5s} {len(latencies) / duration:9.1f} ops/s  '
+                f'p50={_percentile(latencies, 0.5):7.2f}ms  '
+                f'p99={_percentile(latencies, 0.99):8.2f}ms  '
+                f'max={max(latencies, default=0):8.2f}ms  bloqueos={errors}'
+            )
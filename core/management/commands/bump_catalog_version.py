@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Incrementa la versión del catálogo: los workers recargan su snapshot '
+        'y los ETag cambian. Usar después de modificar productos sin pasar '
+        'por los modelos (QuerySet.update, SQL directo) y al desplegar.'
+    )
+
+    def handle(self, *args, **options):
+        previous, version = catalog.bump_version()
+        self.stdout.write(f'Versión del catálogo: {previous} -> {version}')
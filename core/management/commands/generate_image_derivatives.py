@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import catalog
+from core.images import IMAGE_ERRORS, build_derivatives
+from core.models import Product
+
+
+def _build(product_id, name, media_root, force):
+    # Se ejecuta en otro proceso: solo Pillow y sistema de archivos
+    try:
+        return product_id, build_derivatives(name, media_root, force=force), None
+    except IMAGE_ERRORS as e:
+        return product_id, None, str(e)
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los derivados responsivos (WebP/JPEG de ancho fijo) de todas '
+        'las imágenes de productos en paralelo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Procesos en paralelo (por defecto, uno por CPU).')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerar aunque los derivados estén al día.')
+
+    def handle(self, *args, **options):
+        products = [
+            (pk, name)
+            for pk, name in Product.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('pk', 'image')
+        ]
+        start = time.perf_counter()
+        done = failed = 0
+
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = [
+                pool.submit(_build, pk, name, str(settings.MEDIA_ROOT), options['force'])
+                for pk, name in products
+            ]
+            for future in as_completed(futures):
+                product_id, result, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Producto {product_id}: {error}')
+                    continue
+                width, height, derivatives = result
+                Product.objects.filter(pk=product_id).update(
+                    image_width=width, image_height=height, image_derivatives=derivatives
+                )
+                done += 1
+
+        if done:
+            # Los snapshots de los workers deben ver los nuevos derivados
+            catalog.bump_version()
+        self.stdout.write(
+            f'{done} imágenes procesadas, {failed} con errores, '
+            f'en {time.perf_counter() - start:.1f}s'
+        )
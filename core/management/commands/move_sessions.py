@@ -0,0 +1,67 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.models import CartSession
+from core.routers import sessions_db
+from core.session_backend import SessionStore, cart_lines
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve las sesiones (y sus marcas de carrito) que quedaron en la base '
+        '`default` a la base de sesiones. Sin efecto si no hay nada que mover.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Filas por lote (por defecto 500).')
+
+    def handle(self, *args, **options):
+        target = sessions_db()
+        if target == DEFAULT_DB_ALIAS:
+            self.stdout.write('Las sesiones usan la base default: nada que mover.')
+            return
+        tables = connections[DEFAULT_DB_ALIAS].introspection.table_names()
+        moved = 0
+        for model in (Session, CartSession):
+            if model._meta.db_table in tables:
+                moved += self._move(model, target, options['chunk_size'])
+        self.stdout.write(f'{moved} filas movidas a la base {target}.')
+
+    def _move(self, model, target, chunk_size):
+        """
+        Copia las filas por lotes (sin pisar las que ya existen en `target`) y
+        las elimina de default.
+        """
+        source = model.objects.using(DEFAULT_DB_ALIAS)
+        moved = 0
+        while True:
+            batch = list(source.order_by('pk')[:chunk_size])
+            if not batch:
+                return moved
+            with transaction.atomic(using=target):
+                model.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+                if model is Session:
+                    self._mark_carts(batch, target)
+            source.filter(pk__in=[obj.pk for obj in batch]).delete()
+            moved += len(batch)
+
+    def _mark_carts(self, sessions, target):
+        """
+        Crea las marcas de carrito de las sesiones vigentes de `sessions`
+        (sin pisar las que ya existen en `target`). La migración 0011 las
+        crea en la base de sesiones, que al actualizar una instalación todavía
+        está vacía: las de las sesiones que estaban en default se crean aquí.
+        """
+        store = SessionStore()
+        now = timezone.now()
+        markers = []
+        for session in sessions:
+            if session.expire_date <= now:
+                continue
+            lines = cart_lines(store.decode(session.session_data))
+            if lines:
+                markers.append(CartSession(session_key=session.session_key, items=lines))
+        CartSession.objects.using(target).bulk_create(markers, ignore_conflicts=True)
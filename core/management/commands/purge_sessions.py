@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from core.cart_store import get_cart_store
+from core.sessions import purge_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina las sesiones vencidas (o todas con --all) en lotes, cada uno '
+        'en su propia transacción, y los carritos vencidos del backend de '
+        'carrito (CART_STORE) que los guarda aparte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Eliminar también las sesiones vigentes.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Filas por lote (por defecto SESSION_PURGE_CHUNK_SIZE).')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Segundos de espera entre lotes (por defecto 0).')
+        parser.add_argument('--database', default=None,
+                            help='Base de datos (por defecto la de las sesiones).')
+
+    def handle(self, *args, **options):
+        result = purge_sessions(
+            expired_only=not options['all'],
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            using=options['database'],
+        )
+        self.stdout.write(
+            f"Eliminadas {result['deleted']} sesiones en {result['elapsed']:.3f}s "
+            f"({result['chunks']} lotes)"
+        )
+        carts = get_cart_store().purge()
+        if carts:
+            self.stdout.write(f'Eliminados {carts} carritos vencidos')
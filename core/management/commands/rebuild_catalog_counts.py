@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core import catalog
+from core.counts import rebuild_counts
+from core.models import CatalogCount
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula desde Product los conteos materializados del catálogo '
+        '(CatalogCount) e informa las diferencias corregidas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        before = dict(CatalogCount.objects.using(using).values_list('key', 'count'))
+        after = rebuild_counts(using=using)
+
+        drift = 0
+        for key in sorted(set(before) | set(after)):
+            old, new = before.get(key, 0), after.get(key, 0)
+            if old != new:
+                drift += 1
+                self.stdout.write(f'{key}: {old} -> {new}')
+        if drift:
+            # Invalida los conteos cacheados en los workers
+            catalog.bump_version()
+        self.stdout.write(f'{len(after)} conteos recalculados, {drift} corregidos.')
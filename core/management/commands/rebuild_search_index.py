@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import catalog, search
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde Product el índice de búsqueda (FTS5 en SQLite, '
+        'trigramas en PostgreSQL); necesario después de loaddata o de '
+        'QuerySet.update(), que no pasan por las señales.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.search_enabled(using):
+            self.stdout.write('La base de datos no tiene índice de búsqueda: nada que reconstruir.')
+            return
+        products = Product.objects.using(using).only('id', 'name', 'description')
+        with transaction.atomic(using=using):
+            search.rebuild_index(products.iterator(), using=using)
+        # Invalida los ETag de las búsquedas cacheadas por los clientes
+        catalog.bump_version()
+        self.stdout.write(f'{products.count()} productos indexados.')
@@ -0,0 +1,114 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from core import catalog
+from core.images import DERIVATIVES_DIR, FORMATS, derivative_name, update_product_derivatives
+from core.models import Product
+from core.storage import content_hash, hashed_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Renombra las imágenes de productos por el hash de su contenido '
+        '(deduplicando las repetidas) e informa los archivos de MEDIA_ROOT '
+        'que ya no usa ningún producto (--delete-unreferenced los elimina).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo informar, sin modificar nada.')
+        parser.add_argument('--delete-unreferenced', action='store_true',
+                            help='Eliminar los archivos que no usa ningún producto '
+                                 '(por defecto solo se listan).')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        renamed = missing = 0
+        # Con --dry-run, el nombre que tendría cada producto renombrado
+        planned = {}
+
+        for product in Product.objects.exclude(image='').exclude(image__isnull=True):
+            name = product.image.name
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.isfile(path):
+                missing += 1
+                self.stderr.write(f'Producto {product.pk}: no existe {name}')
+                continue
+
+            with open(path, 'rb') as handle:
+                new_name = hashed_name(name, content_hash(File(handle)))
+                if new_name == name:
+                    continue
+                self.stdout.write(f'{name} -> {new_name}')
+                renamed += 1
+                if dry_run:
+                    planned[product.pk] = new_name
+                    continue
+                # El storage reutiliza el archivo si otro producto ya lo subió
+                new_name = product.image.storage.save(new_name, File(handle, name))
+
+            Product.objects.filter(pk=product.pk).update(image=new_name)
+            product.image.name = new_name
+            update_product_derivatives(product)
+
+        if renamed and not dry_run:
+            catalog.bump_version()
+        self.stdout.write(f'{renamed} imágenes renombradas, {missing} no encontradas.')
+
+        delete = options['delete_unreferenced'] and not dry_run
+        removed, freed = self._collect_garbage(delete, planned)
+        self.stdout.write(
+            f'{removed} archivos huérfanos {"eliminados" if delete else "sin eliminar"} '
+            f'({freed / 1024 / 1024:.1f} MB).'
+        )
+
+    def _referenced(self, planned):
+        """
+        Archivos que usan los productos. Para los de `planned` (pk -> nombre
+        nuevo) se cuentan el nombre nuevo y sus derivados en lugar de los
+        actuales, como quedarían después de renombrarlos.
+        """
+        referenced = set()
+        products = Product.objects.values_list('pk', 'image', 'image_derivatives')
+        for pk, name, derivatives in products:
+            new_name = planned.get(pk)
+            if new_name:
+                name = new_name
+            if name:
+                referenced.add(os.path.normpath(name))
+            for width, entry in (derivatives or {}).items():
+                for fmt in FORMATS:
+                    if new_name:
+                        referenced.add(os.path.normpath(derivative_name(new_name, width, fmt)))
+                    elif entry.get(fmt):
+                        referenced.add(os.path.normpath(entry[fmt]))
+        return referenced
+
+    def _collect_garbage(self, delete, planned):
+        """
+        Lista los archivos de MEDIA_ROOT (originales y derivados) que no
+        referencia ningún Product y, con `delete`, los elimina. Con
+        `planned` (--dry-run) los productos se toman ya renombrados, así
+        la lista coincide con la que eliminaría una ejecución real.
+        """
+        media_root = str(settings.MEDIA_ROOT)
+        referenced = self._referenced(planned)
+        removed = freed = 0
+        for root, dirs, names in os.walk(media_root):
+            relative_root = os.path.relpath(root, media_root)
+            if relative_root not in ('.', DERIVATIVES_DIR):
+                continue
+            for filename in names:
+                relative = os.path.normpath(os.path.join(relative_root, filename))
+                if relative in referenced or filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                freed += os.path.getsize(path)
+                removed += 1
+                self.stdout.write(f'  huérfano: {relative}')
+                if delete:
+                    os.remove(path)
+        return removed, freed
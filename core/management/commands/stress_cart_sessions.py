@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from core import group_commit
+from core.management.benchmark import temporary_databases
+from core.models import Product
+from core.routers import sessions_db
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga de POST /api/cart/: clientes concurrentes (sin cookie '
+        'al empezar, así que cada uno crea su sesión) agregan productos con '
+        '1, 2, 4... hilos, guardando cada sesión en su transacción (direct) o '
+        'por lotes (group, SESSION_GROUP_COMMIT). Usa una base de datos temporal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Cantidades de hilos a probar (por defecto 1 2 4 8).')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Peticiones por hilo (por defecto 200).')
+        parser.add_argument('--clients', type=int, default=10,
+                            help='Clientes (sesiones) distintos por hilo.')
+        parser.add_argument('--products', type=int, default=20,
+                            help='Productos creados en la base temporal.')
+        parser.add_argument('--modes', nargs='+', choices=['direct', 'group'],
+                            default=['direct', 'group'],
+                            help='Formas de guardar las sesiones (por defecto ambas).')
+        parser.add_argument('--synchronous', choices=['off', 'normal', 'full', 'extra'],
+                            help='PRAGMA synchronous de las bases temporales '
+                                 '(por defecto el de SQLITE_PRAGMAS).')
+
+    def handle(self, *args, **options):
+        tmpdir = tempfile.mkdtemp(prefix='stress-cart-')
+        # Bases temporales en archivos (no :memory:) para que los hilos las
+        # compartan; incluye la de sesiones (core/routers.py)
+        pragmas = dict(settings.SQLITE_PRAGMAS)
+        if options['synchronous']:
+            pragmas['synchronous'] = options['synchronous']
+        try:
+            with override_settings(SQLITE_PRAGMAS=pragmas), temporary_databases(tmpdir), override_settings(
+                CATALOG_VERSION_FILE=os.path.join(tmpdir, 'catalog.version'),
+                CART_STORE='core.cart_store.SessionCartStore',
+                ALLOWED_HOSTS=['*'],
+            ):
+                product_ids = [
+                    Product.objects.create(
+                        name=f'Producto {n}', description='', measurement='un', category='co'
+                    ).id
+                    for n in range(options['products'])
+                ]
+                for threads in options['threads']:
+                    for mode in options['modes']:
+                        with override_settings(SESSION_GROUP_COMMIT=mode == 'group'):
+                            elapsed, done, errors, sessions = self._run(threads, product_ids, options)
+                            batches = self._stop_writer() if mode == 'group' else ''
+                        self.stdout.write(
+                            f'{threads:3d} hilos  {mode:6s} {done:6d} ok  {elapsed:7.2f}s  '
+                            f'{done / elapsed if elapsed else 0:9.1f} req/s  '
+                            f'sesiones={sessions}  errores={errors}{batches}'
+                        )
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _stop_writer(self):
+        using = sessions_db()
+        writer = group_commit.get_writer(using)
+        group_commit.stop_writer(using)
+        if not writer.batches:
+            return ''
+        return f'  lotes={writer.batches} ({writer.writes / writer.batches:.1f} escrituras/lote)'
+
+    def _run(self, threads, product_ids, options):
+        counters = {'done': 0, 'errors': 0, 'sessions': set()}
+        lock = threading.Lock()
+
+        def worker():
+            clients = [Client(HTTP_HOST='localhost') for _ in range(options['clients'])]
+            done = errors = 0
+            for i in range(options['requests']):
+                client = clients[i % len(clients)]
+                response = client.post(
+                    '/api/cart/',
+                    {'product_id': product_ids[i % len(product_ids)], 'cantidad': 1,
+                     'measurement': 'un'},
+                    content_type='application/json',
+                )
+                if response.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+            keys = {
+                client.cookies[settings.SESSION_COOKIE_NAME].value
+                for client in clients if settings.SESSION_COOKIE_NAME in client.cookies
+            }
+            connections.close_all()
+            with lock:
+                counters['done'] += done
+                counters['errors'] += errors
+                counters['sessions'] |= keys
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return (
+            time.perf_counter() - start,
+            counters['done'],
+            counters['errors'],
+            len(counters['sessions']),
+        )
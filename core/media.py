@@ -0,0 +1,125 @@
+"""
+Respuestas para archivos de imagen (``serve_media`` y ``resize_media``).
+
+- ``ETag`` (mtime + tamaño) y ``Last-Modified``, con 304 para
+  ``If-None-Match`` / ``If-Modified-Since``.
+- ``Cache-Control`` largo e ``immutable`` para nombres con hash de
+  contenido (p. ej. ``canela.3f9a1c0b2d4e.png``); el resto se cachea
+  ``MEDIA_CACHE_MAX_AGE`` segundos y se revalida.
+- Rangos de bytes (``Range: bytes=...``, un solo rango) con 206/416.
+- Con ``settings.MEDIA_ACCEL_REDIRECT`` la transferencia la hace el proxy
+  (nginx) mediante ``X-Accel-Redirect``; el worker solo calcula cabeceras.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+mimetypes.add_type('image/webp', '.webp')
+
+# Nombre con hash de contenido hexadecimal antes de la extensión (o que es
+# solo el hash, como los de core.storage.ContentHashStorage), opcionalmente
+# con el ancho de un derivado: 3f9a1c0b2d4e5f60.jpg, 3f9a1c0b2d4e5f60-320.webp
+HASHED_NAME_RE = re.compile(r'(?:^|[._-])[0-9a-f]{12,}(?:-\d+)?\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def is_hashed_name(path):
+    return bool(HASHED_NAME_RE.search(os.path.basename(path)))
+
+
+def _parse_range(header, size):
+    """
+    (inicio, fin) inclusivo del rango pedido, None si no hay un rango simple
+    utilizable (se responde el archivo completo) o False si no se puede
+    satisfacer.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Sufijo: los últimos N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, content_type=None, accel_path=None, immutable=None):
+    """
+    Respuesta para el archivo `path` con validadores, 304 y rangos.
+    `accel_path` es la ruta interna del proxy para X-Accel-Redirect (solo se
+    usa si settings.MEDIA_ACCEL_REDIRECT está activo).
+    """
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    if immutable is None:
+        immutable = is_hashed_name(path)
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if immutable
+        else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    if settings.MEDIA_ACCEL_REDIRECT and accel_path:
+        # nginx envía el archivo (y resuelve Range); se conservan estas cabeceras
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_path
+        return finish(response)
+
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return finish(response)
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(path, start, end), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+            return finish(response)
+
+    return finish(FileResponse(open(path, 'rb'), content_type=content_type))
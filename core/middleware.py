@@ -0,0 +1,38 @@
+"""
+Middleware de sesiones con escrituras mínimas.
+"""
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+
+
+class LazySessionMiddleware(SessionMiddleware):
+    """
+    ``SessionMiddleware`` para usar con ``SESSION_SAVE_EVERY_REQUEST = False``:
+
+    - las sesiones se crean recién cuando se guarda algo en ellas y solo se
+      guardan si cambiaron, así que navegar el catálogo no escribe en la base;
+    - la expiración se extiende (sliding expiry) como mucho una vez cada
+      ``SESSION_REFRESH_INTERVAL`` segundos, cuando se usa una sesión existente;
+    - la respuesta lleva ``X-Session-Writes`` con las escrituras de sesión
+      hechas en la petición (lo cuenta ``core.session_backend``).
+    """
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None:
+            return response
+
+        interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', 0)
+        if (
+            session.accessed
+            and not session.modified
+            and session.session_key
+            and hasattr(session, 'needs_refresh')
+            and session.needs_refresh(interval)
+        ):
+            # Guardar la sesión también renueva la cookie y su max_age
+            session.modified = True
+
+        response = super().process_response(request, response)
+        response['X-Session-Writes'] = str(getattr(session, 'writes', 0))
+        return response
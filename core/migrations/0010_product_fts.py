@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from core.search import FTS_TABLE, fold_text
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    Product = apps.get_model('core', 'Product')
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"name, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    for product in Product.objects.using(schema_editor.connection.alias).iterator():
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (%s, %s, %s)",
+            [product.pk, fold_text(product.name), fold_text(product.description)],
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_remove_product_measure_product_measurement'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
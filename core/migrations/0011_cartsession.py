@@ -0,0 +1,54 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:37
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_existing_carts(apps, schema_editor):
+    """
+    Crea las marcas de los carritos de las sesiones vigentes (única vez que
+    se decodifican todas las sesiones).
+    """
+    Session = apps.get_model('sessions', 'Session')
+    CartSession = apps.get_model('core', 'CartSession')
+    alias = schema_editor.connection.alias
+    store = SessionStore()
+
+    batch = []
+    sessions = Session.objects.using(alias).filter(expire_date__gt=timezone.now())
+    for session_key, session_data in sessions.values_list('session_key', 'session_data').iterator():
+        cart = store.decode(session_data).get('cart')
+        if isinstance(cart, dict) and cart:
+            batch.append(CartSession(session_key=session_key, items=len(cart)))
+        if len(batch) >= 500:
+            CartSession.objects.using(alias).bulk_create(batch)
+            batch = []
+    CartSession.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_product_fts'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartSession',
+            fields=[
+                ('session_key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(
+            mark_existing_carts,
+            migrations.RunPython.noop,
+            # Se ejecuta en la base de las sesiones (ver core/routers.py); si
+            # las sesiones siguen en default, move_sessions crea las marcas
+            # al moverlas
+            hints={'model_name': 'cartsession'},
+        ),
+    ]
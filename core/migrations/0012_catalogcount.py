@@ -0,0 +1,38 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:41
+
+from collections import Counter
+
+from django.db import migrations, models
+
+from core.counts import COUNT_FIELDS, product_keys
+
+
+def fill_counts(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    CatalogCount = apps.get_model('core', 'CatalogCount')
+    alias = schema_editor.connection.alias
+
+    totals = Counter()
+    for row in Product.objects.using(alias).values_list(*COUNT_FIELDS).iterator():
+        totals.update(product_keys(*row))
+    CatalogCount.objects.using(alias).bulk_create(
+        [CatalogCount(key=key, count=count) for key, count in totals.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_cartsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCount',
+            fields=[
+                ('key', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:46
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_product_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_image_storage, upload_to=''),
+        ),
+    ]
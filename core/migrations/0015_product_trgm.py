@@ -0,0 +1,44 @@
+from django.db import migrations
+
+from core.search import TRGM_TABLE, fold_text
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Product = apps.get_model('core', 'Product')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f"CREATE TABLE IF NOT EXISTS {TRGM_TABLE} ("
+        f"id bigint PRIMARY KEY, "
+        f"name text NOT NULL, "
+        f"description text NOT NULL, "
+        f"document text GENERATED ALWAYS AS (name || ' ' || description) STORED)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {TRGM_TABLE}_document_gin "
+        f"ON {TRGM_TABLE} USING gin (document gin_trgm_ops)"
+    )
+    for product in Product.objects.using(schema_editor.connection.alias).iterator():
+        schema_editor.execute(
+            f"INSERT INTO {TRGM_TABLE}(id, name, description) VALUES (%s, %s, %s)",
+            [product.pk, fold_text(product.name), fold_text(product.description)],
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TRGM_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_product_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:57
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+import django.db.models.functions.text
+
+
+def lowercase_categories(apps, schema_editor):
+    """
+    Guarda los códigos de categoría existentes en minúsculas.
+    """
+    Product = apps.get_model('core', 'Product')
+    Product.objects.using(schema_editor.connection.alias).exclude(
+        category=Lower('category')
+    ).update(category=Lower('category'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_product_trgm'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_categories, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='core_product_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('featured', True)), fields=['id'], name='core_product_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'id'], name='core_product_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='core_product_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(check=models.Q(('category', django.db.models.functions.text.Lower('category'))), name='core_product_category_lowercase'),
+        ),
+    ]
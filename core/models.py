@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.functions import Lower
+
+from core.storage import get_image_storage
 
 CATEGORY_CHOICES = (
     ('co','Condiments'),
@@ -22,12 +25,44 @@ class Product(models.Model):
     description = models.TextField()
     available = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
-    image = models.ImageField(blank=True, null=True)
+    # Nombres por hash de contenido (ver core/storage.py)
+    image = models.ImageField(blank=True, null=True, storage=get_image_storage)
     category =  models.CharField(choices=CATEGORY_CHOICES, max_length=2)
+    # Dimensiones del original y derivados responsivos (ver core/images.py)
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Listados por categoría, destacados y disponibles (ordenados por id).
+            # Destacados y disponibles son índices parciales: Django compila
+            # `featured=True` como `WHERE "featured"` (sin comparar), que un
+            # índice con la columna booleana al frente no resuelve en SQLite
+            models.Index(fields=['category', 'id'], name='core_product_category_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(featured=True),
+                         name='core_product_featured_idx'),
+            models.Index(fields=['category', 'id'], condition=models.Q(available=True),
+                         name='core_product_available_idx'),
+            models.Index(fields=['name'], name='core_product_name_idx'),
+        ]
+        constraints = [
+            # Los códigos de categoría se guardan en minúsculas, así los
+            # filtros son por igualdad exacta (y usan los índices)
+            models.CheckConstraint(
+                check=models.Q(category=Lower('category')),
+                name='core_product_category_lowercase',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.category:
+            self.category = self.category.lower()
+        super().save(*args, **kwargs)
+
 
 class Collection(models.Model):
     title = models.CharField(max_length=256)
@@ -37,3 +72,30 @@ class Collection(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class CartSession(models.Model):
+    """
+    Marca de las sesiones que tienen carrito y cuántas líneas tiene.
+    La mantiene core.session_backend al guardar la sesión, para poder contar
+    carritos con SQL sin decodificar cada sesión.
+    """
+    session_key = models.CharField(max_length=40, primary_key=True)
+    items = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.session_key} ({self.items})"
+
+
+class CatalogCount(models.Model):
+    """
+    Totales del catálogo materializados: 'total', 'featured', 'available' y
+    'category:<código>'. Los mantienen las señales de Product (ver
+    core/counts.py); `manage.py rebuild_catalog_counts` los recalcula.
+    """
+    key = models.CharField(max_length=32, primary_key=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.count}"
@@ -0,0 +1,74 @@
+"""
+Paginación por cursor (keyset) sobre los registros del snapshot del catálogo.
+
+En lugar de un offset, el cursor guarda la clave de orden del último (o
+primer) producto de la página: la página siguiente empieza con un bisect
+sobre la tupla de claves, así que una página profunda cuesta lo mismo que la
+primera y no hace falta contar los productos. El cursor es opaco para el
+cliente (JSON en base64 url-safe).
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+
+CURSOR_ORDERINGS = ('id', 'category')
+CURSOR_DEFAULT_PAGE_SIZE = 12
+CURSOR_MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(ordering, key, direction):
+    payload = json.dumps({'o': ordering, 'k': list(key), 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Retorna (clave, dirección) del cursor, o (None, 'next') si está vacío.
+    Lanza ValueError si el cursor es inválido o de otro orden.
+    """
+    if not cursor:
+        return None, 'next'
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, direction = tuple(payload['k']), payload['d']
+    except (TypeError, ValueError, KeyError, AttributeError):
+        raise ValueError('Cursor inválido.')
+    if payload.get('o') != ordering or direction not in ('next', 'prev'):
+        raise ValueError('El cursor no corresponde a este listado.')
+    return key, direction
+
+
+def keyset_page(records, keys, ordering, cursor=None, page_size=CURSOR_DEFAULT_PAGE_SIZE):
+    """
+    Página de `records` (ordenados, con `keys` paralelas) a partir de `cursor`.
+    Retorna (registros de la página, datos de paginación).
+    """
+    key, direction = decode_cursor(cursor, ordering)
+    total = len(records)
+
+    try:
+        if key is None:
+            start = 0
+        elif direction == 'next':
+            start = bisect_right(keys, key)
+        else:
+            start = max(0, bisect_left(keys, key) - page_size)
+        end = min(total, start + page_size)
+        if direction == 'prev' and key is not None:
+            end = min(end, bisect_left(keys, key))
+    except TypeError:
+        # Clave con tipos que no se pueden comparar (cursor manipulado)
+        raise ValueError('Cursor inválido.')
+
+    page = records[start:end]
+    has_next = end < total
+    has_previous = start > 0
+    return page, {
+        'ordering': ordering,
+        'page_size': page_size,
+        'has_next': has_next,
+        'has_previous': has_previous,
+        'next_cursor': encode_cursor(ordering, keys[end - 1], 'next') if has_next and page else None,
+        'previous_cursor': encode_cursor(ordering, keys[start], 'prev') if has_previous and page else None,
+    }
@@ -0,0 +1,68 @@
+"""
+Router de bases de datos (``settings.DATABASE_ROUTERS``).
+
+- Sesiones: ``django_session`` y ``CartSession`` viven en la base
+  ``sessions`` (un archivo SQLite propio) cuando está configurada, así las
+  escrituras de sesión de cada visitante no compiten por el lock de
+  escritura con las tablas del catálogo.
+- Catálogo: si existe la base ``catalog`` (el mismo archivo que ``default``
+  abierto con ``mode=ro`` o ``immutable=1``, ver ``CATALOG_DB_MODE``), las
+  lecturas de los modelos de ``core`` van por ella; las escrituras siempre
+  van a ``default``.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SESSIONS_DB_ALIAS = 'sessions'
+CATALOG_DB_ALIAS = 'catalog'
+
+# (app_label, model_name) de las tablas que van a la base de sesiones
+SESSION_MODELS = {('sessions', 'session'), ('core', 'cartsession')}
+
+
+def _is_session_model(app_label, model_name):
+    if app_label == 'sessions':
+        return True
+    return (app_label, model_name) in SESSION_MODELS
+
+
+def sessions_db():
+    return SESSIONS_DB_ALIAS if SESSIONS_DB_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+class DatabaseRouter:
+
+    def db_for_read(self, model, **hints):
+        meta = model._meta
+        if _is_session_model(meta.app_label, meta.model_name):
+            return sessions_db()
+        if meta.app_label == 'core' and CATALOG_DB_ALIAS in settings.DATABASES:
+            # Dentro de una transacción de escritura se lee lo que se escribe
+            if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+                return DEFAULT_DB_ALIAS
+            return CATALOG_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        meta = model._meta
+        if _is_session_model(meta.app_label, meta.model_name):
+            return sessions_db()
+        if meta.app_label == 'core':
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # `catalog` es el mismo archivo que `default`
+        dbs = {obj1._state.db, obj2._state.db}
+        if dbs <= {DEFAULT_DB_ALIAS, CATALOG_DB_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == CATALOG_DB_ALIAS:
+            return False
+        if _is_session_model(app_label, model_name):
+            return db == sessions_db()
+        if db == SESSIONS_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,186 @@
+"""
+Búsqueda de productos sobre un índice FTS5 de SQLite o, con PostgreSQL,
+sobre índices GIN de trigramas (``pg_trgm``).
+
+El índice (``core_product_fts`` en SQLite, ``core_product_trgm`` en
+PostgreSQL) guarda el nombre y la descripción de cada producto ya
+normalizados con Unidecode (sin acentos y en minúsculas), con el ``id`` del
+producto como clave. Se mantiene sincronizado desde las señales de
+``core.signals`` y se crea en las migraciones ``0010_product_fts`` y
+``0015_product_trgm`` (cada una solo en su motor). Los cambios que no pasan
+por las señales (``loaddata``, ``QuerySet.update()``, SQL directo) dejan el
+índice desactualizado; ``manage.py rebuild_search_index`` lo reconstruye.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from unidecode import unidecode
+
+FTS_TABLE = 'core_product_fts'
+TRGM_TABLE = 'core_product_trgm'
+
+# Peso relativo de cada columna en el ranking BM25 (name, description)
+BM25_WEIGHTS = (10.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold_text(text):
+    """
+    Normaliza un texto para indexarlo o buscarlo: "Anís" -> "anis".
+    """
+    return unidecode(text or '').lower()
+
+
+def fts_enabled(using=DEFAULT_DB_ALIAS):
+    """
+    El índice FTS5 solo existe cuando la base de datos es SQLite.
+    """
+    return connections[using].vendor == 'sqlite'
+
+
+def trigram_enabled(using=DEFAULT_DB_ALIAS):
+    """
+    El índice de trigramas solo existe cuando la base de datos es PostgreSQL.
+    """
+    return connections[using].vendor == 'postgresql'
+
+
+def search_enabled(using=DEFAULT_DB_ALIAS):
+    return fts_enabled(using) or trigram_enabled(using)
+
+
+def build_match_expression(query):
+    """
+    Convierte la consulta del usuario en una expresión MATCH de FTS5.
+    Cada palabra se busca como prefijo y todas deben aparecer.
+    """
+    tokens = TOKEN_RE.findall(fold_text(query))
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def index_product(product, using=DEFAULT_DB_ALIAS):
+    """
+    Inserta o reemplaza un producto en el índice.
+    """
+    if trigram_enabled(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {TRGM_TABLE}(id, name, description) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, '
+                f'description = EXCLUDED.description',
+                [product.pk, fold_text(product.name), fold_text(product.description)],
+            )
+        return
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (%s, %s, %s)',
+            [product.pk, fold_text(product.name), fold_text(product.description)],
+        )
+
+
+def remove_product(product_id, using=DEFAULT_DB_ALIAS):
+    """
+    Elimina un producto del índice.
+    """
+    if trigram_enabled(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TRGM_TABLE} WHERE id = %s', [product_id])
+        return
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index(products, using=DEFAULT_DB_ALIAS):
+    """
+    Reconstruye el índice completo a partir de un iterable de productos.
+    """
+    if not search_enabled(using):
+        return
+    table, key = (TRGM_TABLE, 'id') if trigram_enabled(using) else (FTS_TABLE, 'rowid')
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.executemany(
+            f'INSERT INTO {table}({key}, name, description) VALUES (%s, %s, %s)',
+            [
+                (product.pk, fold_text(product.name), fold_text(product.description))
+                for product in products
+            ],
+        )
+
+
+def search_product_ids(query, limit, offset=0, using=DEFAULT_DB_ALIAS):
+    """
+    Busca productos ordenados por BM25 (o por similitud de trigramas con
+    PostgreSQL).
+    Retorna (ids de la página, total de coincidencias); el total sale de la
+    misma consulta mediante una función de ventana, sin un COUNT aparte.
+    """
+    if trigram_enabled(using):
+        return _trigram_product_ids(query, limit, offset, using)
+
+    expression = build_match_expression(query)
+    if not expression:
+        return [], 0
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT id, COUNT(*) OVER () FROM ('
+            f'SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS rank '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+            f') ORDER BY rank, id LIMIT %s OFFSET %s',
+            [expression, limit, offset],
+        )
+        rows = cursor.fetchall()
+
+        if not rows and offset:
+            # Página fuera de rango: aún así informar el total real
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                [expression],
+            )
+            return [], cursor.fetchone()[0]
+
+    total = rows[0][1] if rows else 0
+    return [row[0] for row in rows], total
+
+
+def _trigram_product_ids(query, limit, offset, using):
+    """
+    Búsqueda con pg_trgm: coinciden los productos que contienen todas las
+    palabras (ILIKE, resuelto con el índice GIN) o que se parecen a la
+    consulta completa (operador <% de word_similarity, que tolera errores de
+    tipeo). Se ordena por similitud con el nombre y luego con el texto.
+    """
+    folded = fold_text(query)
+    tokens = TOKEN_RE.findall(folded)
+    if not tokens:
+        return [], 0
+
+    # "_" es comodín en LIKE; \w no incluye "%"
+    patterns = ['%' + token.replace('_', '\\_') + '%' for token in tokens]
+    contains = ' AND '.join(['document ILIKE %s'] * len(patterns))
+    where = f'({contains}) OR %s <%% document'
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT id, COUNT(*) OVER () FROM {TRGM_TABLE} WHERE {where} '
+            f'ORDER BY word_similarity(%s, name) DESC, word_similarity(%s, document) DESC, id '
+            f'LIMIT %s OFFSET %s',
+            [*patterns, folded, folded, folded, limit, offset],
+        )
+        rows = cursor.fetchall()
+
+        if not rows and offset:
+            cursor.execute(f'SELECT COUNT(*) FROM {TRGM_TABLE} WHERE {where}', [*patterns, folded])
+            return [], cursor.fetchone()[0]
+
+    total = rows[0][1] if rows else 0
+    return [row[0] for row in rows], total
@@ -0,0 +1,118 @@
+"""
+Motor de sesiones (``settings.SESSION_ENGINE = 'core.session_backend'``).
+
+Es el motor de base de datos de Django, y además:
+
+- mantiene ``CartSession``: al guardar una sesión cuyo carrito cambió de
+  número de líneas actualiza su marca, así los conteos de carritos se hacen
+  con SQL sin decodificar sesiones;
+- recuerda la fecha de expiración leída de la base, para que
+  ``core.middleware.LazySessionMiddleware`` extienda la expiración solo cada
+  ``SESSION_REFRESH_INTERVAL`` segundos;
+- cuenta las escrituras (`writes`) que hace durante la petición;
+- con ``settings.SESSION_GROUP_COMMIT`` guarda por lotes junto con las
+  sesiones de otros hilos (ver core/group_commit.py).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import router
+from django.utils import timezone
+
+from core.group_commit import SessionWrite, get_writer
+from core.models import CartSession
+
+
+def cart_lines(data):
+    """
+    Número de líneas del carrito guardado en los datos de una sesión.
+    """
+    cart = data.get('cart') if isinstance(data, dict) else None
+    return len(cart) if isinstance(cart, dict) else 0
+
+
+class SessionStore(DBStore):
+    # Líneas del carrito según la última lectura/escritura de la sesión
+    _cart_lines = 0
+    # expire_date de la fila leída (None si la sesión no existía)
+    _expire_date = None
+    # INSERT/UPDATE/DELETE emitidos por esta sesión
+    writes = 0
+    # Datos serializados del último guardado hecho por esta instancia
+    _saved_payload = None
+
+    def _get_session_from_db(self):
+        session = super()._get_session_from_db()
+        self._expire_date = session.expire_date if session else None
+        return session
+
+    def load(self):
+        data = super().load()
+        self._cart_lines = cart_lines(data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        # Sin cambios desde el último guardado de esta petición (p. ej. la
+        # sesión se creó con create() y luego el middleware vuelve a guardar)
+        payload = self.serializer().dumps(self._get_session(no_load=must_create))
+        if not must_create and payload == self._saved_payload:
+            return
+
+        lines = cart_lines(getattr(self, '_session_cache', {}))
+        # Una sesión nueva (create/cycle_key) aún no tiene marca
+        previous = 0 if must_create else self._cart_lines
+
+        if getattr(settings, 'SESSION_GROUP_COMMIT', False):
+            self._save_grouped(must_create, lines if lines != previous else None)
+        else:
+            super().save(must_create=must_create)
+            self._save_marker(lines, previous)
+        self.writes += 1 + (lines != previous)
+        self._saved_payload = payload
+        self._expire_date = self.get_expiry_date()
+        self._cart_lines = lines
+
+    def _save_grouped(self, must_create, lines):
+        """
+        Guarda la sesión (y su marca) en el próximo lote del escritor de
+        core.group_commit; retorna cuando el lote está confirmado.
+        """
+        obj = self.create_model_instance(self._get_session(no_load=must_create))
+        using = router.db_for_write(self.model, instance=obj)
+        get_writer(using).submit(
+            SessionWrite(obj.session_key, obj.session_data, obj.expire_date, must_create, lines)
+        )
+
+    def _save_marker(self, lines, previous):
+        if lines != previous:
+            if lines:
+                CartSession.objects.bulk_create(
+                    [CartSession(session_key=self.session_key, items=lines)],
+                    update_conflicts=True,
+                    unique_fields=['session_key'],
+                    update_fields=['items', 'updated_at'],
+                )
+            else:
+                CartSession.objects.filter(session_key=self.session_key).delete()
+
+    def needs_refresh(self, interval):
+        """
+        Indica si pasaron al menos `interval` segundos desde la última vez que
+        se guardó la sesión (y por lo tanto se fijó su expiración).
+        """
+        if self._expire_date is None:
+            return False
+        saved_at = self._expire_date - timedelta(seconds=self.get_expiry_age())
+        return timezone.now() - saved_at >= timedelta(seconds=interval)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        super().delete(session_key)
+        if session_key is not None:
+            CartSession.objects.filter(session_key=session_key).delete()
+            self.writes += 2
@@ -0,0 +1,167 @@
+"""
+Limpieza e inventario de sesiones.
+
+Las sesiones se eliminan por lotes con un DELETE por conjunto
+(``DELETE ... WHERE session_key IN (SELECT ... LIMIT n)``), cada lote en su
+propia transacción, para no retener el bloqueo de escritura de SQLite
+mientras se borran miles de filas. Lo usan las vistas de administración de
+sesiones, el comando ``purge_sessions`` y el barrido periódico opcional
+(``settings.SESSION_PURGE_INTERVAL``).
+
+El inventario lee las columnas de la tabla y las marcas de ``CartSession``
+(ver core/session_backend.py) en lugar de decodificar cada sesión.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import DatabaseError, connections
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from core.cart_store import get_cart_store
+from core.models import CartSession
+from core.routers import sessions_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def _delete_in_chunks(model, queryset, chunk_size, pause):
+    """
+    Elimina las filas de `queryset` en lotes de `chunk_size`, cada uno en su
+    propia transacción. Retorna (filas eliminadas, lotes).
+    """
+    deleted = chunks = 0
+    while True:
+        keys = queryset.values('session_key')[:chunk_size]
+        # Session y CartSession no tienen relaciones ni receivers: Django
+        # emite un único DELETE ... WHERE session_key IN (SELECT ... LIMIT n)
+        count, _ = model.objects.using(queryset.db).filter(session_key__in=keys).delete()
+        if not count:
+            break
+        deleted += count
+        chunks += 1
+        if count < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted, chunks
+
+
+def purge_sessions(expired_only=True, chunk_size=None, pause=0, using=None):
+    """
+    Elimina las sesiones vencidas (o todas, con `expired_only=False`) en
+    lotes de `chunk_size` filas, esperando `pause` segundos entre lotes.
+    Retorna {'deleted': filas eliminadas, 'chunks': lotes, 'elapsed': segundos}.
+    """
+    chunk_size = chunk_size or getattr(settings, 'SESSION_PURGE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    using = using or sessions_db()
+    start = time.perf_counter()
+
+    sessions = Session.objects.using(using)
+    if expired_only:
+        sessions = sessions.filter(expire_date__lt=timezone.now())
+    deleted, chunks = _delete_in_chunks(Session, sessions, chunk_size, pause)
+
+    if deleted:
+        # Marcas de carrito de las sesiones eliminadas, también por lotes
+        orphans = CartSession.objects.using(using).exclude(
+            session_key__in=Session.objects.using(using).values('session_key')
+        )
+        _delete_in_chunks(CartSession, orphans, chunk_size, pause)
+
+    return {
+        'deleted': deleted,
+        'chunks': chunks,
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def session_inventory(after=None, using=None):
+    """
+    Sesiones ordenadas por session_key (a partir de `after`, exclusivo),
+    como tuplas (session_key, expire_date, líneas del carrito o None).
+    Los carritos salen de CartSession con una subconsulta por clave primaria.
+    """
+    using = using or sessions_db()
+    cart_items = CartSession.objects.using(using).filter(
+        session_key=OuterRef('session_key')
+    ).values('items')[:1]
+    sessions = Session.objects.using(using).order_by('session_key')
+    if after:
+        sessions = sessions.filter(session_key__gt=after)
+    return sessions.annotate(cart_items=Subquery(cart_items)).values_list(
+        'session_key', 'expire_date', 'cart_items'
+    )
+
+
+def sessions_summary(using=None):
+    """
+    Totales de sesiones y carritos calculados con agregados SQL.
+    """
+    using = using or sessions_db()
+    now = timezone.now()
+    totals = Session.objects.using(using).aggregate(
+        total=Count('session_key'),
+        active=Count('session_key', filter=Q(expire_date__gt=now)),
+    )
+    active_keys = Session.objects.using(using).filter(expire_date__gt=now).values('session_key')
+    carts = CartSession.objects.using(using).filter(
+        items__gt=0, session_key__in=active_keys
+    ).aggregate(carts=Count('session_key'), items=Sum('items'))
+    return {
+        'total_sessions': totals['total'],
+        'active_sessions': totals['active'],
+        'expired_sessions': totals['total'] - totals['active'],
+        'carts_with_items': carts['carts'],
+        'cart_items': carts['items'] or 0,
+    }
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _sweep_loop(interval, chunk_size, pause):
+    while True:
+        time.sleep(interval)
+        try:
+            result = purge_sessions(chunk_size=chunk_size, pause=pause)
+            get_cart_store().purge()
+        except (DatabaseError, sqlite3.Error):
+            # p. ej. la tabla aún no existe porque faltan migraciones
+            logger.exception('No se pudieron eliminar las sesiones vencidas')
+            continue
+        finally:
+            connections.close_all()
+        if result['deleted']:
+            logger.info(
+                'Eliminadas %s sesiones vencidas en %.3fs (%s lotes)',
+                result['deleted'], result['elapsed'], result['chunks'],
+            )
+
+
+def start_sweeper(interval, chunk_size=None, pause=0.05):
+    """
+    Inicia (una sola vez por proceso) un hilo que elimina las sesiones
+    vencidas (y los carritos vencidos del backend de carrito) cada
+    `interval` segundos. La pausa entre lotes deja pasar las
+    escrituras de las peticiones mientras se purga.
+    """
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is not None and _sweeper.is_alive():
+            return _sweeper
+        _sweeper = threading.Thread(
+            target=_sweep_loop,
+            args=(interval, chunk_size, pause),
+            name='session-sweeper',
+            daemon=True,
+        )
+        _sweeper.start()
+        return _sweeper
@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import autocomplete, catalog, counts, images, search
+from core.models import Collection, Product
+
+
+def _on_catalog_commit(using, callback=None):
+    """
+    Incrementa la versión del catálogo cuando la transacción se confirma,
+    para que ningún worker recargue datos todavía no visibles.
+    `callback(previous_version, version)` aplica cambios locales del worker.
+    """
+    def bump():
+        previous_version, version = catalog.bump_version()
+        if callback is not None:
+            callback(previous_version, version)
+
+    transaction.on_commit(bump, using=using)
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, raw=False, using=None, **kwargs):
+    """
+    Recuerda a qué conteos aportaba el producto y qué imagen tenía antes
+    de guardarlo.
+    """
+    if raw:
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = Product.objects.using(using).filter(pk=instance.pk).values_list(
+            *counts.COUNT_FIELDS, 'image'
+        ).first()
+    instance._previous_count_keys = counts.product_keys(*previous[:-1]) if previous else []
+    instance._previous_image = previous[-1] if previous else None
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, using=None, **kwargs):
+    """
+    Mantiene sincronizados los índices de búsqueda y los conteos al guardar
+    un producto.
+    """
+    if raw:
+        # loaddata: solo se invalidan los snapshots y los ETag (el índice de
+        # búsqueda se reconstruye con rebuild_search_index)
+        _on_catalog_commit(using)
+        return
+    search.index_product(instance, using=using)
+    counts.apply_delta(
+        getattr(instance, '_previous_count_keys', []),
+        counts.product_keys(*(getattr(instance, field) for field in counts.COUNT_FIELDS)),
+        using=using,
+    )
+    # Derivados responsivos cuando se sube o cambia la imagen, después del
+    # commit: Pillow no corre dentro de la transacción. Las imágenes que
+    # quedaron sin derivados se procesan con generate_image_derivatives.
+    image_name = instance.image.name if instance.image else None
+    if image_name != getattr(instance, '_previous_image', None):
+        transaction.on_commit(lambda: images.update_product_derivatives(instance), using=using)
+    _on_catalog_commit(
+        using,
+        lambda previous, version: autocomplete.product_saved(instance, previous, version),
+    )
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, using=None, **kwargs):
+    """
+    Elimina el producto de los índices de búsqueda y de los conteos.
+    """
+    product_id = instance.pk
+    search.remove_product(product_id, using=using)
+    counts.apply_delta(
+        counts.product_keys(*(getattr(instance, field) for field in counts.COUNT_FIELDS)),
+        [],
+        using=using,
+    )
+    _on_catalog_commit(
+        using,
+        lambda previous, version: autocomplete.product_deleted(product_id, previous, version),
+    )
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def collection_changed(sender, instance, raw=False, using=None, **kwargs):
+    _on_catalog_commit(using)
+
+
+@receiver(m2m_changed, sender=Collection.collection_products.through)
+def collection_products_changed(sender, action, using=None, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _on_catalog_commit(using)
+
+
+def catalog_migrated(sender, plan=None, **kwargs):
+    """
+    Las migraciones pueden cambiar el catálogo sin pasar por los modelos
+    (RunPython, RunSQL): se incrementa la versión si se aplicó alguna.
+    Se conecta en CoreConfig.ready para que corra una vez por migrate.
+    """
+    if plan:
+        catalog.bump_version()
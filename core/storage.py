@@ -0,0 +1,62 @@
+"""
+Almacenamiento de ``Product.image`` direccionado por contenido.
+
+El nombre del archivo es el hash SHA-256 (truncado) de su contenido más la
+extensión, p. ej. ``3f9a1c0b2d4e5f60.jpg``:
+
+- subir dos veces la misma imagen reutiliza el archivo existente;
+- el nombre cambia si cambia el contenido, así que la URL se puede cachear
+  como ``immutable`` (ver core/media.py).
+
+``manage.py rehash_media`` renombra las imágenes existentes y, con
+``--delete-unreferenced``, elimina las que ya no usa ningún producto.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 16
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+def content_hash(content):
+    """
+    SHA-256 (hex) de un archivo de Django, leído por bloques.
+    """
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    ext = os.path.splitext(name)[1].lower()
+    ext = EXTENSION_ALIASES.get(ext, ext)
+    return f"{digest[:HASH_LENGTH]}{ext}"
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    FileSystemStorage (MEDIA_ROOT) que nombra los archivos por su contenido
+    y no vuelve a escribir los que ya existen.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            from django.core.files import File
+            content = File(content, name)
+        name = hashed_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+def get_image_storage():
+    return ContentHashStorage()
@@ -1,3 +1,1444 @@
-from django.test import TestCase
+import json
+import os
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from core import (
+    autocomplete, cart_store, catalog, counts, db, fuzzy, group_commit, image_cache, images,
+    media, pagination, search, sessions, signals,
+)
+from core.api import conditional, serializers
+from core.api.views import CartApiViewSet
+from core.db import configure_connection, is_read_only, pragma_statements
+from core.models import CartSession, CatalogCount, Product
+from core.routers import CATALOG_DB_ALIAS, SESSIONS_DB_ALIAS, DatabaseRouter, sessions_db
+from core.session_backend import SessionStore
+from core.sessions import purge_sessions
+
+
+class CatalogStateMixin:
+    """
+    Aísla el estado del catálogo entre pruebas: archivo de versión propio en
+    un directorio temporal e índices en memoria del worker vacíos.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        settings_override = override_settings(CATALOG_VERSION_FILE=f'{self.tmpdir}/catalog.version')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self._reset_worker_state()
+        self.addCleanup(self._reset_worker_state)
+
+    def _reset_worker_state(self):
+        catalog._snapshot = None
+        autocomplete._index = None
+        fuzzy._index = None
+        counts._cache = (None, {})
+
+
+class MediaRootMixin:
+    """
+    MEDIA_ROOT y caché de imágenes en directorios temporales.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGE_CACHE_DIR=Path(self.media_root) / 'image-cache'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+def image_bytes(width=400, height=300, fmt='PNG', color=(200, 80, 20)):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def create_product(name, description='', category='co', **fields):
+    return Product.objects.create(
+        name=name, description=description, category=category, **fields
+    )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Planes de consulta de SQLite')
+class ProductIndexPlanTests(TestCase):
+    """
+    Los filtros frecuentes de productos, tal como los compila el ORM, deben
+    resolverse con los índices de la migración 0016, sin recorrer la tabla
+    ni ordenar en un B-tree temporal.
+    """
+
+    def assertUsesIndex(self, queryset, index):
+        # Una línea por paso: "<id> <padre> 0 SEARCH core_product USING INDEX ..."
+        plan = queryset.explain().splitlines()
+        self.assertTrue(any(f'INDEX {index}' in step for step in plan), plan)
+        # Con un índice parcial, SCAN ... USING INDEX recorre solo sus filas
+        self.assertFalse(any(step.endswith('SCAN core_product') for step in plan), plan)
+        self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+    def test_category_filter_uses_category_id_index(self):
+        queryset = Product.objects.filter(category='co').order_by('id')
+        self.assertUsesIndex(queryset, 'core_product_category_id_idx')
+
+    def test_category_keyset_page_uses_category_id_index(self):
+        queryset = Product.objects.filter(category='co', id__gt=10).order_by('id')[:12]
+        self.assertUsesIndex(queryset, 'core_product_category_id_idx')
+
+    def test_featured_filter_uses_partial_index(self):
+        queryset = Product.objects.filter(featured=True).order_by('id')
+        # El ORM no compara la columna booleana con un parámetro
+        self.assertIn('WHERE "core_product"."featured" ORDER BY', str(queryset.query))
+        self.assertUsesIndex(queryset, 'core_product_featured_idx')
+
+    def test_available_category_filter_uses_partial_index(self):
+        queryset = Product.objects.filter(available=True, category='co').order_by('id')
+        self.assertUsesIndex(queryset.values_list('id', 'category'), 'core_product_available_idx')
+        self.assertUsesIndex(queryset, 'core_product_available_idx')
+
+    def test_name_lookup_uses_name_index(self):
+        self.assertUsesIndex(Product.objects.filter(name='Canela'), 'core_product_name_idx')
+
+
+class ProductCategoryNormalizationTests(TestCase):
+
+    def test_save_stores_lowercase_category(self):
+        product = Product.objects.create(
+            name='Anís', description='', measurement='g', category='CO'
+        )
+        product.refresh_from_db()
+        self.assertEqual(product.category, 'co')
+
+    def test_uppercase_category_is_rejected_by_constraint(self):
+        product = Product.objects.create(name='Anís', description='', category='co')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.filter(pk=product.pk).update(category='CO')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Índice FTS5 de SQLite')
+class FullTextSearchTests(CatalogStateMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', 'Corteza de Ceilán')
+        cls.anis = create_product('Anís estrellado', 'Semillas con aroma a canela')
+        cls.benzoato = create_product('Benzoato de sodio', 'Conservante', category='ch')
+
+    def test_search_is_accent_insensitive_and_prefix_based(self):
+        self.assertEqual(search.search_product_ids('anis', limit=10), ([self.anis.pk], 1))
+        self.assertEqual(search.search_product_ids('ceilan', limit=10), ([self.canela.pk], 1))
+        self.assertEqual(search.search_product_ids('benz sod', limit=10), ([self.benzoato.pk], 1))
+
+    def test_name_matches_rank_before_description_matches(self):
+        ids, total = search.search_product_ids('canela', limit=10)
+        self.assertEqual(ids, [self.canela.pk, self.anis.pk])
+        self.assertEqual(total, 2)
+
+    def test_total_is_reported_for_pages_past_the_end(self):
+        self.assertEqual(search.search_product_ids('canela', limit=1, offset=1), ([self.anis.pk], 2))
+        self.assertEqual(search.search_product_ids('canela', limit=10, offset=10), ([], 2))
+
+    def test_index_follows_updates_and_deletes(self):
+        self.benzoato.name = 'Sorbato de potasio'
+        self.benzoato.save()
+        self.assertEqual(search.search_product_ids('benzoato', limit=10), ([], 0))
+        self.assertEqual(search.search_product_ids('sorbato', limit=10), ([self.benzoato.pk], 1))
+        self.benzoato.delete()
+        self.assertEqual(search.search_product_ids('sorbato', limit=10), ([], 0))
+
+    def test_search_endpoint(self):
+        response = self.client.get('/api/consulta/search/', {'q': 'Anís'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.json()['products']], [self.anis.pk])
+        self.assertEqual(response.json()['total'], 1)
+        self.assertEqual(self.client.get('/api/consulta/search/', {'q': 'a'}).status_code, 400)
+
+
+@skipUnless(search.search_enabled(), 'Requiere SQLite o PostgreSQL')
+class SearchBackendTests(CatalogStateMixin, TestCase):
+    """
+    search_product_ids con el índice del motor en uso (FTS5 o pg_trgm).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', 'Corteza de Ceilán')
+        cls.anis = create_product('Anís estrellado', 'Semillas con aroma a canela')
+
+    def test_hit_and_miss(self):
+        self.assertEqual(search.search_product_ids('Anís', limit=10), ([self.anis.pk], 1))
+        self.assertEqual(search.search_product_ids('ceilan', limit=10), ([self.canela.pk], 1))
+        self.assertEqual(search.search_product_ids('vainilla', limit=10), ([], 0))
+        self.assertEqual(search.search_product_ids('canela', limit=10, offset=5), ([], 2))
+
+    def test_search_endpoint(self):
+        response = self.client.get('/api/consulta/search/', {'q': 'estrellado'})
+        self.assertEqual([p['id'] for p in response.json()['products']], [self.anis.pk])
+        self.assertEqual(response.json()['total'], 1)
+
+    def test_rebuild_command_repairs_changes_that_skip_signals(self):
+        Product.objects.filter(pk=self.anis.pk).update(name='Clavo de olor')
+        Product.objects.bulk_create([Product(name='Vainilla', description='', category='co')])
+        self.assertEqual(search.search_product_ids('vainilla', limit=10), ([], 0))
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('3 productos indexados', out.getvalue())
+        self.assertEqual(search.search_product_ids('clavo', limit=10), ([self.anis.pk], 1))
+        self.assertEqual(search.search_product_ids('estrellado', limit=10), ([], 0))
+        self.assertEqual(search.search_product_ids('vainilla', limit=10)[1], 1)
+
+    @skipUnless(search.trigram_enabled(), 'Similitud de trigramas de PostgreSQL')
+    def test_trigram_search_tolerates_typos(self):
+        ids, total = search.search_product_ids('canella', limit=10)
+        self.assertEqual(ids[0], self.canela.pk)
+        self.assertEqual(total, len(ids))
+        self.assertEqual(search.search_product_ids('estrelado', limit=10), ([self.anis.pk], 1))
+
+    @skipUnless(search.trigram_enabled(), 'Similitud de trigramas de PostgreSQL')
+    def test_like_wildcards_in_the_query_are_literal(self):
+        self.assertEqual(search.search_product_ids('ca_ela', limit=10), ([], 0))
+
+
+class PrefixIndexTests(TestCase):
+
+    def build_index(self, *names):
+        return autocomplete.PrefixIndex(
+            Product(pk=pk, name=name, category='co') for pk, name in enumerate(names, 1)
+        )
+
+    def test_every_query_word_must_prefix_a_name_token(self):
+        index = self.build_index('Canela en rama', 'Canela molida', 'Anís estrellado')
+        self.assertEqual([entry.id for entry in index.suggest('can mol')], [2])
+        self.assertEqual([entry.id for entry in index.suggest('ANIS')], [3])
+        self.assertEqual(index.suggest('canela xyz'), [])
+        self.assertEqual(index.suggest('  '), [])
+
+    def test_names_starting_with_the_query_come_first(self):
+        index = self.build_index('Pimienta de cayena', 'Cayena molida', 'Cayena')
+        self.assertEqual([entry.id for entry in index.suggest('cayena')], [3, 2, 1])
+        self.assertEqual(len(index.suggest('cayena', limit=2)), 2)
+
+    def test_add_replaces_previous_tokens_and_remove_prunes(self):
+        index = self.build_index('Canela')
+        index.add(Product(pk=1, name='Clavo de olor', category='co'))
+        self.assertEqual(index.suggest('canela'), [])
+        self.assertEqual([entry.name for entry in index.suggest('clavo')], ['Clavo de olor'])
+        index.remove(1)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index._root.children, {})
+
+    def test_suggest_while_other_thread_updates(self):
+        index = self.build_index(*(f'Canela {n}' for n in range(200)))
+        stop = threading.Event()
+        errors = []
+
+        def mutate():
+            n = 0
+            while not stop.is_set():
+                pk = 1000 + n % 50
+                index.add(Product(pk=pk, name=f'Canela extra {n}', category='co'))
+                index.remove(pk)
+                n += 1
+
+        def read():
+            try:
+                for _ in range(300):
+                    index.suggest('canela', limit=5)
+            except Exception as exc:
+                errors.append(exc)
+
+        writer = threading.Thread(target=mutate)
+        writer.start()
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        stop.set()
+        writer.join()
+        self.assertEqual(errors, [])
+
+
+class AutocompleteEndpointTests(CatalogStateMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama')
+        cls.clavo = create_product('Clavo de olor')
+
+    def suggestions(self, query):
+        response = self.client.get('/api/consulta/autocomplete/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()['suggestions']]
+
+    def test_suggestions_follow_committed_saves(self):
+        self.assertEqual(self.suggestions('can'), ['Canela en rama'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.canela.name = 'Cardamomo'
+            self.canela.save()
+        self.assertEqual(self.suggestions('can'), [])
+        self.assertEqual(self.suggestions('car'), ['Cardamomo'])
+
+    def test_invalid_limit(self):
+        response = self.client.get('/api/consulta/autocomplete/', {'q': 'c', 'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class FuzzySearchTests(CatalogStateMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.benzoato = create_product('Benzoato de sodio', 'Conservante', category='ch')
+        cls.canela = create_product('Canela en rama', 'Corteza de Ceilán')
+        cls.anis = create_product('Anís estrellado', 'Semillas con aroma a canela')
+
+    def test_edit_distance_is_bounded(self):
+        self.assertEqual(fuzzy.bounded_levenshtein('bensoato', 'benzoato', 2), 1)
+        self.assertEqual(fuzzy.bounded_levenshtein('canela', 'clavo', 2), 3)
+        self.assertEqual(fuzzy.trigrams('sal'), {'  s', ' sa', 'sal', 'al '})
+
+    def test_typos_and_incomplete_words_match(self):
+        index = fuzzy.get_index()
+        self.assertEqual(index.search('bensoato'), [self.benzoato.pk])
+        self.assertEqual(index.search('canel'), [self.canela.pk, self.anis.pk])
+        self.assertEqual(index.search('benzoato canela'), [])
+        self.assertEqual(index.search('xyzzy'), [])
+
+    def test_index_is_rebuilt_when_the_catalog_changes(self):
+        index = fuzzy.get_index()
+        self.assertIs(fuzzy.get_index(), index)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('Cúrcuma', 'Raíz molida')
+        self.assertIsNot(fuzzy.get_index(), index)
+        self.assertEqual(len(fuzzy.get_index().search('curcuma')), 1)
+
+    def test_fuzzy_search_endpoint(self):
+        response = self.client.get('/api/consulta/search/', {'q': 'bensoato', 'fuzzy': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['fuzzy'])
+        self.assertEqual([p['id'] for p in response.json()['products']], [self.benzoato.pk])
+
+
+class CatalogSnapshotTests(CatalogStateMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', featured=True)
+        cls.comino = create_product('Comino', category='CO')
+        cls.almendra = create_product('Almendra', category='nt')
+
+    def test_bump_version_is_monotonic(self):
+        self.assertEqual(catalog.get_version(), 0)
+        self.assertIsNone(catalog.get_last_modified())
+        previous, version = catalog.bump_version()
+        self.assertEqual(previous, 0)
+        self.assertEqual(catalog.get_version(), version)
+        self.assertGreater(catalog.bump_version()[1], version)
+        self.assertIsNotNone(catalog.get_last_modified())
+
+    def test_snapshot_indexes(self):
+        snapshot = catalog.get_snapshot()
+        self.assertIs(catalog.get_snapshot(), snapshot)
+        self.assertEqual(snapshot.get(str(self.canela.pk)).name, 'Canela en rama')
+        self.assertIsNone(snapshot.get('x'))
+        self.assertEqual([r.id for r in snapshot.featured], [self.canela.pk])
+        self.assertEqual([r.id for r in snapshot.category('CO')], [self.canela.pk, self.comino.pk])
+        records, keys = snapshot.ordered('category')
+        self.assertEqual([r.id for r in records], [self.canela.pk, self.comino.pk, self.almendra.pk])
+        self.assertEqual(keys[0], ('co', self.canela.pk))
+
+    def test_snapshot_is_reloaded_only_after_commit(self):
+        snapshot = catalog.get_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comino.featured = True
+            self.comino.save()
+            # Antes del commit los workers siguen con el snapshot anterior
+            self.assertIs(catalog.get_snapshot(), snapshot)
+        reloaded = catalog.get_snapshot()
+        self.assertIsNot(reloaded, snapshot)
+        self.assertEqual([r.id for r in reloaded.featured], [self.canela.pk, self.comino.pk])
+
+    def test_rolled_back_changes_do_not_bump_the_version(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    self.almendra.delete()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(catalog.get_version(), 0)
+
+    def test_featured_endpoint_reflects_committed_changes(self):
+        def featured_ids():
+            response = self.client.get('/api/products/featured/')
+            return [product['id'] for product in response.json()['featured_products']]
+
+        self.assertEqual(featured_ids(), [self.canela.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.canela.featured = False
+            self.canela.save()
+        self.assertEqual(featured_ids(), [])
+        response = self.client.get(f'/api/item/{self.almendra.pk}/')
+        self.assertEqual(response.json()['product']['name'], 'Almendra')
+        self.assertEqual(self.client.get('/api/item/999999/').status_code, 404)
+
+
+class ConditionalCatalogTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', featured=True)
+
+    def setUp(self):
+        super().setUp()
+        catalog.bump_version()
+
+    def get_featured(self, **headers):
+        return self.client.get('/api/products/featured/', **headers)
+
+    def test_matching_etag_returns_304(self):
+        response = self.get_featured()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get_featured(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_changes_with_the_cart_and_the_catalog(self):
+        etag = self.get_featured()['ETag']
+        self.client.post('/api/cart/', {'product_id': self.canela.pk}, content_type='application/json')
+        with_cart = self.get_featured(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(with_cart.status_code, 200)
+        self.assertNotEqual(with_cart['ETag'], etag)
+        catalog.bump_version()
+        self.assertNotEqual(self.get_featured()['ETag'], with_cart['ETag'])
+
+    def test_etag_includes_the_application_version(self):
+        etag = self.get_featured()['ETag']
+        conditional.etag_salt.cache_clear()
+        self.addCleanup(conditional.etag_salt.cache_clear)
+        with override_settings(APP_VERSION='otra'):
+            self.assertNotEqual(self.get_featured()['ETag'], etag)
+
+    def test_session_responses_ignore_if_modified_since(self):
+        response = self.get_featured()
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        far_future = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        self.assertEqual(self.get_featured(HTTP_IF_MODIFIED_SINCE=far_future).status_code, 200)
+
+    def test_public_responses_use_last_modified(self):
+        response = self.client.get('/api/products/featured/', {'session': '0'})
+        self.assertIn('public', response['Cache-Control'])
+        response = self.client.get(
+            '/api/products/featured/', {'session': '0'},
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_applied_migrations_bump_the_version(self):
+        version = catalog.get_version()
+        signals.catalog_migrated(sender=None, plan=[])
+        self.assertEqual(catalog.get_version(), version)
+        signals.catalog_migrated(sender=None, plan=[('migration', False)])
+        self.assertGreater(catalog.get_version(), version)
+
+
+class InCartFieldTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', featured=True)
+        cls.clavo = create_product('Clavo de olor', featured=True)
+
+    def featured(self, **params):
+        response = self.client.get('/api/products/featured/', params)
+        return {product['id']: product for product in response.json()['featured_products']}
+
+    def test_in_cart_marks_only_products_in_the_cart(self):
+        self.client.post('/api/cart/', {'product_id': self.clavo.pk}, content_type='application/json')
+        products = self.featured()
+        self.assertEqual(products[self.canela.pk]['session'], {'in_cart': False})
+        self.assertEqual(products[self.clavo.pk]['session'], {'in_cart': True})
+
+    def test_session_field_can_be_omitted(self):
+        products = self.featured(session='0')
+        self.assertNotIn('session', products[self.canela.pk])
+
+    def test_cart_is_loaded_once_per_request(self):
+        self.client.post('/api/cart/', {'product_id': self.clavo.pk}, content_type='application/json')
+        with mock.patch(
+            'core.api.serializers.cart_product_ids', wraps=serializers.cart_product_ids
+        ) as cart_ids:
+            self.featured()
+        self.assertEqual(cart_ids.call_count, 1)
+
+
+class CartStoreTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama')
+
+    def use_store(self, backend, **options):
+        settings_override = override_settings(CART_STORE=backend, CART_STORE_OPTIONS=options)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def assertCartRoundTrip(self):
+        response = self.client.post(
+            '/api/cart/', {'product_id': self.canela.pk, 'cantidad': 2},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        cart = self.client.get('/api/cart/').json()
+        self.assertEqual(list(cart['cart']), [str(self.canela.pk)])
+        self.assertEqual(cart['total_items'], 2)
+
+        self.client.delete(f'/api/cart/{self.canela.pk}/')
+        self.assertEqual(self.client.get('/api/cart/').json()['cart'], {})
+
+    def test_session_store_round_trip(self):
+        self.use_store('core.cart_store.SessionCartStore')
+        self.assertCartRoundTrip()
+
+    def test_signed_cookie_store_round_trip(self):
+        self.use_store('core.cart_store.SignedCookieCartStore')
+        self.assertCartRoundTrip()
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_local_store_round_trip(self):
+        self.use_store(
+            'core.cart_store.LocalCartStore',
+            path=f'{self.tmpdir}/carts.sqlite3', flush_interval=0,
+        )
+        self.assertCartRoundTrip()
+
+    def test_local_store_buffered_writes_are_visible_and_flushed(self):
+        self.use_store(
+            'core.cart_store.LocalCartStore',
+            path=f'{self.tmpdir}/carts.sqlite3', flush_interval=60,
+        )
+        self.client.post('/api/cart/', {'product_id': self.canela.pk}, content_type='application/json')
+        self.assertEqual(list(self.client.get('/api/cart/').json()['cart']), [str(self.canela.pk)])
+        self.assertEqual(cart_store.get_cart_store().flush(), 1)
+
+    def test_local_store_purges_stale_carts(self):
+        store = cart_store.LocalCartStore(path=f'{self.tmpdir}/carts.sqlite3', flush_interval=0)
+        store._write({'viejo': '{}'})
+        with store._connection() as conn:
+            conn.execute("UPDATE carts SET updated_at = updated_at - 3600 WHERE cart_id = 'viejo'")
+        store._write({'nuevo': '{}'})
+        self.assertEqual(store.purge(max_age=60, chunk_size=1), 1)
+        rows = store._connection().execute('SELECT cart_id FROM carts').fetchall()
+        self.assertEqual(rows, [('nuevo',)])
+
+
+class CartBatchTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', measurement='g')
+        cls.clavo = create_product('Clavo de olor', measurement='un')
+
+    def batch(self, *operations):
+        return self.client.post(
+            '/api/cart/batch/', {'operations': list(operations)}, content_type='application/json'
+        )
+
+    def test_operations_are_applied_in_order_with_one_session_write(self):
+        self.client.post('/api/cart/', {'product_id': self.clavo.pk}, content_type='application/json')
+        single = self.client.post(
+            '/api/cart/', {'product_id': self.clavo.pk}, content_type='application/json'
+        )
+        response = self.batch(
+            {'op': 'add', 'product_id': self.canela.pk, 'cantidad': 1, 'measurement': 'kg'},
+            {'op': 'update', 'product_id': self.canela.pk, 'cantidad': 250, 'measurement': 'gm'},
+            {'op': 'add', 'product_id': self.clavo.pk, 'cantidad': 3},
+            {'op': 'remove', 'product_id': self.clavo.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Session-Writes'], single['X-Session-Writes'])
+        self.assertEqual(list(response.json()['cart']), [str(self.canela.pk)])
+        self.assertEqual(response.json()['summary']['total_grams'], 250)
+        self.assertEqual(response.json()['summary']['lines'], 1)
+
+    def test_invalid_operation_rejects_the_whole_batch(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.canela.pk},
+            {'op': 'remove', 'product_id': self.clavo.pk},
+            {'op': 'rename', 'product_id': self.canela.pk},
+            {'op': 'add', 'product_id': 999999},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2, 3])
+        self.assertEqual(self.client.get('/api/cart/').json()['cart'], {})
+
+    def test_operations_must_be_a_bounded_list(self):
+        self.assertEqual(self.batch().status_code, 400)
+        operations = [{'op': 'add', 'product_id': self.canela.pk}] * 201
+        self.assertEqual(self.batch(*operations).status_code, 400)
+
+
+class CartSummaryTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', measurement='g')
+        cls.clavo = create_product('Clavo de olor', measurement='un')
+
+    def test_incremental_summary_matches_a_full_recount(self):
+        view = CartApiViewSet()
+        cart = {}
+        summary = view._cart_summary(cart)
+        changes = [
+            (str(self.canela.pk), [1500, 'gm', 'kg']),
+            (str(self.clavo.pk), [3, 'un']),
+            (str(self.canela.pk), [250.5, 'gm']),
+            (str(self.clavo.pk), None),
+        ]
+        for key, line in changes:
+            old = cart.pop(key, None)
+            if line is not None:
+                cart[key] = line
+            view._update_summary(summary, old, line)
+            self.assertEqual(summary, view._cart_summary(cart))
+
+    def test_endpoints_return_the_stored_summary(self):
+        self.client.post(
+            '/api/cart/', {'product_id': self.clavo.pk, 'cantidad': 2}, content_type='application/json'
+        )
+        response = self.client.post(
+            '/api/cart/', {'product_id': self.canela.pk, 'cantidad': 1, 'measurement': 'kg'},
+            content_type='application/json',
+        )
+        # total_units suma la cantidad de todas las líneas (también los
+        # gramos), igual que el cálculo original
+        self.assertEqual(
+            response.json()['summary'],
+            {
+                'total_items': 3, 'total_units': 1002, 'total_grams': 1000, 'lines': 2,
+                'cart_total_units': 0, 'cart_total_grams': 1000,
+            },
+        )
+        self.client.delete(f'/api/cart/{self.clavo.pk}/')
+        self.assertEqual(self.client.get('/api/cart/').json()['total_items'], 1)
+
+    def test_missing_or_stale_summary_is_recomputed(self):
+        session = self.client.session
+        session['cart'] = {str(self.clavo.pk): [4, 'un']}
+        session['cart_summary'] = {'total_items': 1, 'total_units': 1, 'total_grams': 0, 'lines': 7}
+        session.save()
+        self.assertEqual(self.client.get('/api/cart/').json()['total_items'], 4)
+
+
+class CompactCartTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', 'Corteza', measurement='g')
+        cls.clavo = create_product('Clavo de olor', measurement='un')
+
+    def test_session_stores_compact_lines(self):
+        self.client.post(
+            '/api/cart/', {'product_id': self.canela.pk, 'cantidad': 1.5, 'measurement': 'kg'},
+            content_type='application/json',
+        )
+        self.client.post(
+            '/api/cart/', {'product_id': self.clavo.pk, 'cantidad': 2}, content_type='application/json'
+        )
+        self.assertEqual(
+            self.client.session['cart'],
+            {str(self.canela.pk): [1500.0, 'gm', 'kg'], str(self.clavo.pk): [2, 'un']},
+        )
+
+    def test_lines_are_hydrated_from_the_catalog(self):
+        session = self.client.session
+        session['cart'] = {str(self.canela.pk): [1250, 'gm', 'kg'], '999999': [1, 'un']}
+        session.save()
+        cart = self.client.get('/api/cart/').json()['cart']
+        line = cart[str(self.canela.pk)]
+        self.assertEqual(line['name'], 'Canela en rama')
+        self.assertEqual(line['cantidad_formateada'], '1kg 250g')
+        self.assertEqual(line['cantidad_detalle'], {'kg': 1, 'gm': 250})
+        self.assertEqual(line['last_measurement'], 'kg')
+        # Producto eliminado del catálogo: la línea se conserva sin datos
+        self.assertIsNone(cart['999999']['name'])
+
+    def test_legacy_lines_are_converted_on_read(self):
+        session = self.client.session
+        session['cart'] = {
+            str(self.canela.pk): {
+                'id': self.canela.pk, 'name': 'Canela', 'cantidad': 500, 'medida': 'gm',
+                'cantidad_total_gramos': 500, 'last_measurement': 'gm',
+            },
+            str(self.clavo.pk): {
+                'id': self.clavo.pk, 'cantidad': 3, 'medida': 'un', 'cantidad_total_unidades': 3,
+            },
+        }
+        session.save()
+        cart = self.client.get('/api/cart/').json()['cart']
+        self.assertEqual(cart[str(self.canela.pk)]['cantidad_total_gramos'], 500)
+        self.assertEqual(cart[str(self.clavo.pk)]['cantidad_total_unidades'], 3)
+
+        self.client.post(
+            '/api/cart/', {'product_id': self.clavo.pk, 'cantidad': 1}, content_type='application/json'
+        )
+        self.assertEqual(
+            self.client.session['cart'],
+            {str(self.canela.pk): [500.0, 'gm'], str(self.clavo.pk): [4, 'un']},
+        )
+
+
+class PurgeSessionsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.using = sessions_db()
+        now = timezone.now()
+        for n in range(7):
+            expire_date = now + timedelta(days=-1 if n < 5 else 1)
+            Session.objects.using(self.using).create(
+                session_key=f'sesion{n}', session_data='', expire_date=expire_date
+            )
+            CartSession.objects.using(self.using).create(session_key=f'sesion{n}', items=1)
+
+    def test_expired_sessions_and_their_markers_are_deleted_in_chunks(self):
+        result = purge_sessions(chunk_size=2)
+        self.assertEqual((result['deleted'], result['chunks']), (5, 3))
+        remaining = {'sesion5', 'sesion6'}
+        self.assertEqual(
+            set(Session.objects.using(self.using).values_list('session_key', flat=True)), remaining
+        )
+        self.assertEqual(
+            set(CartSession.objects.using(self.using).values_list('session_key', flat=True)), remaining
+        )
+
+    def test_orphan_markers_are_deleted_in_chunks(self):
+        with mock.patch('core.sessions._delete_in_chunks', wraps=sessions._delete_in_chunks) as chunks:
+            purge_sessions(expired_only=False, chunk_size=3)
+        self.assertEqual([c.args[0] for c in chunks.call_args_list], [Session, CartSession])
+        self.assertTrue(all(c.args[2] == 3 for c in chunks.call_args_list))
+        self.assertFalse(CartSession.objects.using(self.using).exists())
+
+    def test_purge_sessions_command(self):
+        out = StringIO()
+        call_command('purge_sessions', '--chunk-size', '10', stdout=out)
+        self.assertIn('Eliminadas 5 sesiones', out.getvalue())
+
+    def test_sweeper_is_started_by_the_gunicorn_worker_hook(self):
+        config = runpy.run_path(str(Path(settings.BASE_DIR) / 'gunicorn.conf.py'))
+        with mock.patch('core.sessions.start_sweeper') as start_sweeper:
+            with override_settings(SESSION_PURGE_INTERVAL=0):
+                config['post_worker_init'](worker=None)
+            start_sweeper.assert_not_called()
+            with override_settings(SESSION_PURGE_INTERVAL=600):
+                config['post_worker_init'](worker=None)
+            start_sweeper.assert_called_once_with(600)
+
+
+class SessionInventoryTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        using = sessions_db()
+        now = timezone.now()
+        for n in range(5):
+            Session.objects.using(using).create(
+                session_key=f'sesion{n}', session_data='no-se-decodifica',
+                expire_date=now + timedelta(days=-1 if n == 4 else 1),
+            )
+        CartSession.objects.using(using).create(session_key='sesion1', items=3)
+        CartSession.objects.using(using).create(session_key='sesion4', items=2)
+
+    def test_inventory_reads_cart_markers_without_decoding(self):
+        rows = list(sessions.session_inventory(after='sesion0'))
+        self.assertEqual([row[0] for row in rows], ['sesion1', 'sesion2', 'sesion3', 'sesion4'])
+        self.assertEqual(rows[0][2], 3)
+        self.assertIsNone(rows[1][2])
+
+    def test_list_sessions_is_paginated_by_cursor(self):
+        page = self.client.get('/api/sessions/list/', {'limit': 2}).json()
+        self.assertEqual([row['session_key'] for row in page['sessions']], ['sesion0', 'sesion1'])
+        self.assertEqual(page['sessions'][1]['cart_items'], 3)
+        self.assertEqual(page['next_cursor'], 'sesion1')
+        page = self.client.get('/api/sessions/list/', {'limit': 3, 'cursor': 'sesion1'}).json()
+        self.assertEqual(page['count'], 3)
+        self.assertIsNone(page['next_cursor'])
+        self.assertTrue(page['sessions'][-1]['is_expired'])
+
+    def test_list_sessions_stream(self):
+        response = self.client.get('/api/sessions/list/', {'stream': '1', 'cursor': 'sesion2'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['session_key'] for line in lines], ['sesion3', 'sesion4'])
+
+    def test_sessions_summary(self):
+        self.assertEqual(
+            self.client.get('/api/cart/sessions_summary/').json(),
+            {
+                'total_sessions': 5, 'active_sessions': 4, 'expired_sessions': 1,
+                'carts_with_items': 1, 'cart_items': 3,
+            },
+        )
+
+
+class SessionCreationTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama')
+
+    def test_colliding_session_key_is_retried_with_a_new_key(self):
+        existing = SessionStore()
+        existing.create()
+        store = SessionStore()
+        with mock.patch.object(
+            SessionStore, '_get_new_session_key', side_effect=[existing.session_key, 'b' * 32]
+        ):
+            store.create()
+        self.assertEqual(store.session_key, 'b' * 32)
+        self.assertEqual(Session.objects.using(sessions_db()).count(), 2)
+
+    def test_each_new_client_gets_its_own_session(self):
+        keys = set()
+        for _ in range(3):
+            client = self.client_class()
+            response = client.post(
+                '/api/cart/', {'product_id': self.canela.pk}, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            keys.add(response.json()['session_key'])
+            self.assertEqual(client.cookies[settings.SESSION_COOKIE_NAME].value, response.json()['session_key'])
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(Session.objects.using(sessions_db()).count(), 3)
+
+
+class SessionWriteTests(CatalogStateMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', featured=True)
+
+    def session_count(self):
+        return Session.objects.using(sessions_db()).count()
+
+    def test_read_only_requests_do_not_write_sessions(self):
+        for url in ('/api/cart/', '/api/products/featured/', '/api/consulta/autocomplete/?q=ca'):
+            response = self.client.get(url)
+            self.assertEqual(response['X-Session-Writes'], '0', url)
+        self.assertEqual(self.session_count(), 0)
+
+        self.client.post('/api/cart/', {'product_id': self.canela.pk}, content_type='application/json')
+        for url in ('/api/cart/', '/api/products/featured/'):
+            self.assertEqual(self.client.get(url)['X-Session-Writes'], '0', url)
+
+    def test_clearing_an_empty_cart_does_not_create_a_session(self):
+        response = self.client.post('/api/cart-clear/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Session-Writes'], '0')
+        self.assertIsNone(response.json()['session_key'])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.session_count(), 0)
+
+    def test_removing_the_last_line_keeps_the_existing_session(self):
+        self.client.post('/api/cart/', {'product_id': self.canela.pk}, content_type='application/json')
+        response = self.client.post('/api/cart-clear/')
+        self.assertNotEqual(response['X-Session-Writes'], '0')
+        self.assertEqual(self.client.session['cart'], {})
+        self.assertFalse(CartSession.objects.using(sessions_db()).exists())
+        self.assertEqual(self.client.post('/api/cart-clear/')['X-Session-Writes'], '0')
+        self.assertEqual(self.session_count(), 1)
+
+
+class CursorPaginationTests(CatalogStateMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = [
+            create_product(f'Producto {n}', category='nt' if n % 2 else 'co').pk for n in range(7)
+        ]
+
+    def walk(self, url, **params):
+        ids, cursor, pages = [], '', 0
+        while cursor is not None:
+            response = self.client.get(url, {**params, 'cursor': cursor, 'session': '0'})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids += [product['id'] for product in body['products']]
+            cursor = body['pagination']['next_cursor']
+            pages += 1
+        return ids, pages
+
+    def test_pages_cover_the_catalog_in_order(self):
+        self.assertEqual(self.walk('/api/consulta/', page_size=3), (self.ids, 3))
+        ids, _ = self.walk('/api/consulta/', page_size=2, ordering='category')
+        self.assertEqual(ids, self.ids[0::2] + self.ids[1::2])
+
+    def test_previous_cursor_returns_the_previous_page(self):
+        first = self.client.get('/api/consulta/', {'cursor': '', 'page_size': 3}).json()
+        second = self.client.get(
+            '/api/consulta/', {'cursor': first['pagination']['next_cursor'], 'page_size': 3}
+        ).json()
+        self.assertTrue(second['pagination']['has_previous'])
+        back = self.client.get(
+            '/api/consulta/', {'cursor': second['pagination']['previous_cursor'], 'page_size': 3}
+        ).json()
+        self.assertEqual(back['products'], first['products'])
+        self.assertNotIn('total_products', back['pagination'])
+
+    def test_category_cursor_and_count(self):
+        self.assertEqual(self.walk('/api/category/NT/', page_size=2), (self.ids[1::2], 2))
+        response = self.client.get('/api/category/co/', {'cursor': '', 'count': '1'})
+        self.assertEqual(response.json()['pagination']['total_products'], 4)
+
+    def test_invalid_or_foreign_cursors_are_rejected(self):
+        self.assertEqual(self.client.get('/api/category/co/', {'cursor': 'xyz'}).status_code, 400)
+        id_cursor = pagination.encode_cursor('id', (self.ids[2],), 'next')
+        response = self.client.get('/api/consulta/', {'cursor': id_cursor, 'ordering': 'category'})
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ValueError):
+            pagination.keyset_page((), (), 'id', pagination.encode_cursor('id', ('a',), 'sideways'))
+
+
+class CatalogCountTests(CatalogStateMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.canela = create_product('Canela en rama', featured=True)
+        cls.almendra = create_product('Almendra', category='nt', available=False)
+
+    def stored_counts(self):
+        return dict(CatalogCount.objects.exclude(count=0).values_list('key', 'count'))
+
+    def test_signals_apply_only_the_difference(self):
+        self.assertEqual(
+            self.stored_counts(),
+            {'total': 2, 'category:co': 1, 'category:nt': 1, 'featured': 1, 'available': 1},
+        )
+        self.almendra.category = 'co'
+        self.almendra.available = True
+        self.almendra.save()
+        self.canela.delete()
+        self.assertEqual(self.stored_counts(), {'total': 1, 'category:co': 1, 'available': 1})
+
+    def test_rebuild_fixes_drift_from_queryset_updates(self):
+        Product.objects.filter(pk=self.canela.pk).update(featured=False)
+        out = StringIO()
+        call_command('rebuild_catalog_counts', stdout=out)
+        self.assertIn('featured: 1 -> 0', out.getvalue())
+        self.assertNotIn('featured', self.stored_counts())
+        self.assertGreater(catalog.get_version(), 0)
+
+    def test_categories_endpoint_reads_the_counts(self):
+        body = self.client.get('/api/category/', {'session': '0'}).json()
+        by_code = {category['code']: category['product_count'] for category in body['categories']}
+        self.assertEqual((by_code['co'], by_code['nt'], by_code['gr']), (1, 1, 0))
+        self.assertEqual(
+            (body['total_products'], body['featured_products'], body['available_products']), (2, 1, 1)
+        )
+        with self.assertNumQueries(0):
+            counts.get_counts()
+
+
+class ImageDerivativeTests(MediaRootMixin, CatalogStateMixin, TestCase):
+
+    def create_with_image(self, content, name='foto.png'):
+        return create_product('Canela', image=SimpleUploadedFile(name, content))
+
+    def test_derivatives_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            product = self.create_with_image(image_bytes(400, 300))
+            product.refresh_from_db()
+            self.assertEqual(product.image_derivatives, {})
+        self.assertTrue(callbacks)
+
+        product.refresh_from_db()
+        self.assertEqual((product.image_width, product.image_height), (400, 300))
+        self.assertEqual(sorted(product.image_derivatives, key=int), ['160', '320'])
+        entry = product.image_derivatives['320']
+        self.assertEqual((entry['width'], entry['height']), (320, 240))
+        for fmt in images.FORMATS:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, entry[fmt])))
+
+    def test_undecodable_images_are_logged_and_skipped(self):
+        with self.assertLogs('core.images', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            product = self.create_with_image(b'no es una imagen')
+        product.refresh_from_db()
+        self.assertIsNone(product.image_width)
+
+    def test_decompression_bombs_are_rejected(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            with self.assertLogs('core.images', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                product = self.create_with_image(image_bytes(400, 300))
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives, {})
+
+    def test_saves_without_an_image_change_do_not_retry(self):
+        with self.assertLogs('core.images', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            product = self.create_with_image(b'no es una imagen')
+        with mock.patch('core.images.update_product_derivatives') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = 'Canela molida'
+                product.save()
+        update.assert_not_called()
+
+    def test_missing_source_logs_a_warning(self):
+        product = create_product('Canela')
+        product.image.name = 'no-existe.png'
+        with self.assertLogs('core.images', 'WARNING') as logs:
+            images.update_product_derivatives(product)
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING'])
+
+
+class ImageResizeTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.media_root, 'foto.jpg')
+        with open(self.source, 'wb') as handle:
+            handle.write(image_bytes(800, 600, 'JPEG'))
+
+    def test_grid_size_is_resized_and_cached(self):
+        response = self.client.get('/images/320x0/foto.jpg')
+        self.assertEqual(response.status_code, 200)
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as resized:
+            self.assertEqual(resized.size, (320, 240))
+        with mock.patch('core.image_cache._render') as render:
+            self.assertEqual(self.client.get('/images/320x0/foto.jpg').status_code, 200)
+        render.assert_not_called()
+
+    def test_other_sizes_and_paths_are_rejected(self):
+        for url in (
+            '/images/321x0/foto.jpg', '/images/0x0/foto.jpg', '/images/4096x4096/foto.jpg',
+            '/images/320x0/otra.jpg', '/images/320x0/../foto.jpg',
+        ):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_frontend_sizes_on_the_grid_are_accepted(self):
+        for url in ('/images/96x96/foto.jpg', '/images/0x240/foto.jpg', '/images/2048x0/foto.jpg'):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    @override_settings(IMAGE_RESIZE_STEP=10, IMAGE_RESIZE_MAX_DIMENSION=100)
+    def test_grid_comes_from_settings(self):
+        self.assertEqual(self.client.get('/images/100x100/foto.jpg').status_code, 200)
+        self.assertEqual(self.client.get('/images/96x96/foto.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/images/160x0/foto.jpg').status_code, 404)
+
+    def test_decompression_bomb_is_not_found(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            response = self.client.get('/images/320x0/foto.jpg')
+        self.assertEqual(response.status_code, 404)
+
+    @skipUnless(image_cache.fcntl is not None, 'Requiere fcntl')
+    def test_concurrent_requests_render_once_and_keep_the_lock_file(self):
+        render = mock.Mock(side_effect=image_cache._render)
+        barrier = threading.Barrier(4)
+
+        def resize():
+            barrier.wait()
+            image_cache.get_resized(self.source, 160, 0)
+
+        with mock.patch('core.image_cache._render', render):
+            threads = [threading.Thread(target=resize) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(render.call_count, 1)
+        target = image_cache.variant_path(self.source, 160, 0)
+        self.assertTrue(os.path.exists(f'{target}.lock'))
+        self.assertEqual([path for _, _, path in image_cache._scan()], [target])
+
+
+class MediaResponseTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = bytes(range(256)) * 4
+        for name in ('foto.png', '3f9a1c0b2d4e5f60.png'):
+            with open(os.path.join(self.media_root, name), 'wb') as handle:
+                handle.write(self.content)
+
+    def get(self, path='foto.png', **headers):
+        return self.client.get(f'/images/{path}', **headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_validators_and_304(self):
+        response = self.get()
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        not_modified = self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_hashed_names_are_immutable(self):
+        self.assertIn('immutable', self.get('3f9a1c0b2d4e5f60.png')['Cache-Control'])
+        self.assertNotIn('immutable', self.get()['Cache-Control'])
+        self.assertTrue(media.is_hashed_name('derivatives/3f9a1c0b2d4e5f60-320.webp'))
+        self.assertFalse(media.is_hashed_name('canela-2024.png'))
+
+    def test_byte_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(self.body(response), self.content[10:20])
+
+        suffix = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(suffix), self.content[-5:])
+        open_ended = self.get(HTTP_RANGE='bytes=1020-')
+        self.assertEqual(self.body(open_ended), self.content[1020:])
+
+    def test_unsatisfiable_range_returns_416(self):
+        for header in ('bytes=5000-', 'bytes=-0', 'bytes=20-10'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_stale_if_range_returns_the_whole_file(self):
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otro"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1,4-5').status_code, 200)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_accel_redirect(self):
+        response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/_media/foto.png')
+        self.assertEqual(response.content, b'')
+
+    def test_missing_files_and_traversal_return_404(self):
+        self.assertEqual(self.get('otra.png').status_code, 404)
+        self.assertEqual(self.get('../manage.py').status_code, 404)
+
+
+class ContentHashStorageTests(MediaRootMixin, CatalogStateMixin, TestCase):
+
+    def test_identical_uploads_share_one_file(self):
+        content = image_bytes(200, 100)
+        first = create_product('Canela', image=SimpleUploadedFile('canela.PNG', content))
+        second = create_product('Clavo', image=SimpleUploadedFile('clavo.png', content))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^[0-9a-f]{16}\.png$')
+        self.assertTrue(media.is_hashed_name(first.image.name))
+        self.assertEqual(
+            [name for name in os.listdir(self.media_root) if name.endswith('.png')],
+            [first.image.name],
+        )
+
+    def write(self, name, content):
+        with open(os.path.join(self.media_root, name), 'wb') as handle:
+            handle.write(content)
+
+    def test_rehash_media_dry_run_lists_what_a_real_run_deletes(self):
+        self.write('canela.png', image_bytes(200, 100))
+        self.write('huerfano.png', b'sin uso')
+        product = create_product('Canela')
+        Product.objects.filter(pk=product.pk).update(image='canela.png')
+        images.update_product_derivatives(Product.objects.get(pk=product.pk))
+        derivatives = sorted(
+            os.path.join(images.DERIVATIVES_DIR, name)
+            for name in os.listdir(os.path.join(self.media_root, images.DERIVATIVES_DIR))
+        )
+
+        def orphans(*args):
+            out = StringIO()
+            call_command('rehash_media', *args, stdout=out, stderr=StringIO())
+            return sorted(
+                line.split('huérfano: ')[1] for line in out.getvalue().splitlines()
+                if 'huérfano: ' in line
+            )
+
+        preview = orphans('--dry-run')
+        self.assertEqual(preview, sorted(['canela.png', 'huerfano.png', *derivatives]))
+        self.assertEqual(orphans('--delete-unreferenced'), preview)
+
+    def test_rehash_media_renames_and_only_deletes_when_asked(self):
+        content = image_bytes(200, 100)
+        self.write('canela.png', content)
+        self.write('huerfano.png', b'sin uso')
+        product = create_product('Canela')
+        Product.objects.filter(pk=product.pk).update(image='canela.png')
+
+        call_command('rehash_media', stdout=StringIO(), stderr=StringIO())
+        product.refresh_from_db()
+        self.assertRegex(product.image.name, r'^[0-9a-f]{16}\.png$')
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'huerfano.png')))
+
+        call_command('rehash_media', '--delete-unreferenced', '--dry-run', stdout=StringIO())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'huerfano.png')))
+
+        out = StringIO()
+        call_command('rehash_media', '--delete-unreferenced', stdout=out)
+        self.assertIn('huérfano: huerfano.png', out.getvalue())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'huerfano.png')))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'canela.png')))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, product.image.name)))
+
+
+class SQLitePragmaTests(TestCase):
+
+    def test_statements_are_validated_and_busy_timeout_goes_first(self):
+        statements = pragma_statements(
+            {'journal_mode': 'WAL', 'busy_timeout': '5000', 'cache_size': '', 'synchronous': 'normal'}
+        )
+        self.assertEqual(
+            statements,
+            ['PRAGMA busy_timeout = 5000', 'PRAGMA journal_mode = wal', 'PRAGMA synchronous = normal'],
+        )
+        with self.assertRaises(ValueError):
+            pragma_statements({'journal_mode': 'wal; DROP TABLE core_product'})
+        with self.assertRaises(ValueError):
+            pragma_statements({'foreign_keys': 'on'})
+
+    def test_read_only_connections_keep_the_journal_mode(self):
+        self.assertTrue(is_read_only({'NAME': 'file:/data/db.sqlite3?mode=ro'}))
+        self.assertTrue(is_read_only({'NAME': 'file:/data/db.sqlite3?immutable=1'}))
+        self.assertFalse(is_read_only({'NAME': '/data/db.sqlite3'}))
+
+        executed = []
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.execute.side_effect = executed.append
+        read_only = mock.Mock(vendor='sqlite', settings_dict={'NAME': 'file:db?mode=ro'})
+        read_only.cursor.return_value = cursor
+        with override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'busy_timeout': 100}):
+            configure_connection(sender=None, connection=read_only)
+        self.assertEqual(executed, ['PRAGMA busy_timeout = 100'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'PRAGMA de SQLite')
+    def test_new_connections_get_the_configured_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], int(settings.SQLITE_PRAGMAS['busy_timeout']))
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_application_code_does_not_import_test_utilities(self):
+        self.assertFalse(hasattr(db, 'setup_databases'))
+
+
+class DatabaseRouterTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.router = DatabaseRouter()
+
+    def test_session_models_go_to_the_sessions_database(self):
+        for model in (Session, CartSession):
+            self.assertEqual(self.router.db_for_read(model), sessions_db())
+            self.assertEqual(self.router.db_for_write(model), sessions_db())
+        with mock.patch.dict(settings.DATABASES):
+            settings.DATABASES.pop(SESSIONS_DB_ALIAS, None)
+            self.assertEqual(self.router.db_for_write(Session), DEFAULT_DB_ALIAS)
+
+    def test_catalog_reads_use_the_read_only_alias_outside_transactions(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        self.assertEqual(self.router.db_for_write(Product), DEFAULT_DB_ALIAS)
+        with mock.patch.dict(settings.DATABASES, {CATALOG_DB_ALIAS: {}}):
+            with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+                self.assertEqual(self.router.db_for_read(Product), CATALOG_DB_ALIAS)
+            with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+                self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_write(Product), DEFAULT_DB_ALIAS)
+            self.assertFalse(self.router.allow_migrate(CATALOG_DB_ALIAS, 'core', 'product'))
+
+
+@skipUnless(SESSIONS_DB_ALIAS in settings.DATABASES, 'Requiere la base de sesiones')
+class MoveSessionsTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Una instalación anterior: las sesiones todavía en default
+        with connections[DEFAULT_DB_ALIAS].schema_editor() as editor:
+            editor.create_model(Session)
+        self.addCleanup(self._drop_default_sessions)
+
+    def _drop_default_sessions(self):
+        with connections[DEFAULT_DB_ALIAS].schema_editor() as editor:
+            editor.delete_model(Session)
+
+    def test_move_copies_sessions_and_rebuilds_cart_markers(self):
+        store = SessionStore()
+        now = timezone.now()
+        rows = [
+            ('concarrito', {'cart': {'1': {'quantity': 2}, '2': {'quantity': 1}}}, 1),
+            ('sincarrito', {'cart': {}}, 1),
+            ('vencida', {'cart': {'1': {'quantity': 1}}}, -1),
+        ]
+        for session_key, data, days in rows:
+            Session.objects.using(DEFAULT_DB_ALIAS).create(
+                session_key=session_key, session_data=store.encode(data),
+                expire_date=now + timedelta(days=days),
+            )
+
+        call_command('move_sessions', chunk_size=2, stdout=StringIO())
+
+        self.assertFalse(Session.objects.using(DEFAULT_DB_ALIAS).exists())
+        self.assertEqual(
+            set(Session.objects.using(SESSIONS_DB_ALIAS).values_list('session_key', flat=True)),
+            {'concarrito', 'sincarrito', 'vencida'},
+        )
+        self.assertEqual(
+            list(CartSession.objects.using(SESSIONS_DB_ALIAS).values_list('session_key', 'items')),
+            [('concarrito', 2)],
+        )
+
+
+class GroupCommitTests(TransactionTestCase):
+    # El escritor guarda desde su propio hilo: los datos deben estar confirmados
+    databases = '__all__'
+
+    def setUp(self):
+        self.using = sessions_db()
+        self.writer = group_commit.GroupCommitWriter(self.using, max_batch=8, max_wait=50)
+        self.addCleanup(self.writer.stop)
+
+    def write(self, session_key, must_create=True, cart_lines=None, data='datos'):
+        return group_commit.SessionWrite(
+            session_key, data, timezone.now() + timedelta(days=1), must_create, cart_lines
+        )
+
+    def submit_while_blocked(self, writes):
+        """
+        Envía `writes` desde hilos propios mientras el escritor confirma un
+        primer lote, así llegan todas al lote siguiente. Retorna las
+        excepciones de cada envío.
+        """
+        blocked, release = threading.Event(), threading.Event()
+        apply = self.writer._apply
+
+        def blocking_apply(write):
+            if write.session_key == 'primera':
+                blocked.set()
+                release.wait()
+            return apply(write)
+
+        errors = {}
+
+        def submit(write):
+            try:
+                self.writer.submit(write)
+            except Exception as exc:
+                errors[write.session_key] = exc
+
+        with mock.patch.object(self.writer, '_apply', side_effect=blocking_apply):
+            threads = [threading.Thread(target=submit, args=(write,))
+                       for write in [self.write('primera')] + writes]
+            threads[0].start()
+            blocked.wait()
+            for thread in threads[1:]:
+                thread.start()
+            while self.writer._queue.qsize() < len(writes):
+                time.sleep(0.001)
+            release.set()
+            for thread in threads:
+                thread.join()
+        return errors
+
+    def test_concurrent_writes_share_one_commit(self):
+        errors = self.submit_while_blocked(
+            [self.write(f'sesion{n}', cart_lines=n) for n in range(4)]
+        )
+        self.assertEqual(errors, {})
+        self.assertEqual((self.writer.batches, self.writer.writes), (2, 5))
+        self.assertEqual(Session.objects.using(self.using).count(), 5)
+        self.assertEqual(
+            list(CartSession.objects.using(self.using).order_by('pk').values_list('session_key', 'items')),
+            [('sesion1', 1), ('sesion2', 2), ('sesion3', 3)],
+        )
+
+    def test_update_and_marker_removal(self):
+        self.writer.submit(self.write('sesion', cart_lines=2))
+        self.writer.submit(self.write('sesion', must_create=False, cart_lines=0, data='otros'))
+        self.assertEqual(Session.objects.using(self.using).get().session_data, 'otros')
+        self.assertFalse(CartSession.objects.using(self.using).exists())
+
+    def test_errors_reach_only_the_write_that_caused_them(self):
+        self.writer.submit(self.write('existente'))
+        errors = self.submit_while_blocked([
+            self.write('existente'),
+            self.write('nueva', cart_lines=1),
+            self.write('inexistente', must_create=False),
+        ])
+        self.assertIsInstance(errors.pop('existente'), CreateError)
+        self.assertIsInstance(errors.pop('inexistente'), UpdateError)
+        self.assertEqual(errors, {})
+        self.assertTrue(CartSession.objects.using(self.using).filter(session_key='nueva').exists())
+
+    def test_failed_batch_is_retried_write_by_write(self):
+        apply = self.writer._apply
+
+        def failing_apply(write):
+            if write.session_key == 'rota':
+                raise IntegrityError('falla de prueba')
+            return apply(write)
+
+        with mock.patch.object(self.writer, '_apply', side_effect=failing_apply):
+            with self.assertLogs('core.group_commit', 'ERROR'):
+                errors = self.submit_while_blocked([self.write('rota'), self.write('buena')])
+        self.assertIsInstance(errors.pop('rota'), IntegrityError)
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            set(Session.objects.using(self.using).values_list('session_key', flat=True)),
+            {'primera', 'buena'},
+        )
+
+    @skipUnless(SESSIONS_DB_ALIAS in settings.DATABASES, 'Requiere la base de sesiones')
+    def test_each_database_gets_its_own_writer(self):
+        self.addCleanup(group_commit.stop_writer)
+        sessions_writer = group_commit.get_writer(SESSIONS_DB_ALIAS)
+        default_writer = group_commit.get_writer(DEFAULT_DB_ALIAS)
+        self.assertIsNot(sessions_writer, default_writer)
+        self.assertEqual(
+            (sessions_writer.using, default_writer.using), (SESSIONS_DB_ALIAS, DEFAULT_DB_ALIAS)
+        )
+        self.assertIs(group_commit.get_writer(SESSIONS_DB_ALIAS), sessions_writer)
+
+        group_commit.stop_writer(DEFAULT_DB_ALIAS)
+        self.assertIs(group_commit.get_writer(SESSIONS_DB_ALIAS), sessions_writer)
+        self.assertIsNot(group_commit.get_writer(DEFAULT_DB_ALIAS), default_writer)
+
+    @override_settings(SESSION_GROUP_COMMIT=True)
+    def test_session_store_saves_through_the_writer(self):
+        self.addCleanup(group_commit.stop_writer)
+        session = SessionStore()
+        session['cart'] = {'1': {'quantity': 1}}
+        session.save()
+        self.assertEqual(group_commit.get_writer(self.using).writes, 1)
+        self.assertEqual(session.writes, 2)
+        self.assertEqual(CartSession.objects.using(self.using).get().items, 1)
+        self.assertEqual(SessionStore(session.session_key).load()['cart'], {'1': {'quantity': 1}})
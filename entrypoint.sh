@@ -3,6 +3,14 @@ set -e
 
 echo "Ejecutando migraciones..."
 python manage.py migrate --noinput
+# Base de las sesiones, separada del catálogo (si está configurada: ver
+# SESSION_DB_NAME en condimentos/settings.py)
+if python manage.py shell -c "from django.conf import settings; exit('sessions' not in settings.DATABASES)"; then
+    python manage.py migrate --database sessions --noinput
+    python manage.py move_sessions
+fi
+# El código nuevo puede serializar distinto: invalidar snapshots y ETag
+python manage.py bump_catalog_version
 
 echo "Recopilando archivos estáticos..."
 python manage.py collectstatic --noinput
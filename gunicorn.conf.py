@@ -0,0 +1,17 @@
+"""
+Configuración de gunicorn. Se carga sola desde el directorio de trabajo
+(/app), así que aplica al CMD del Dockerfile sin opciones adicionales.
+"""
+
+
+def post_worker_init(worker):
+    """
+    Tareas en segundo plano que solo deben correr en los workers del
+    servidor, no en migrate, shell ni en las pruebas.
+    """
+    from django.conf import settings
+
+    # Barrido periódico opcional de sesiones vencidas
+    if settings.SESSION_PURGE_INTERVAL:
+        from core.sessions import start_sweeper
+        start_sweeper(settings.SESSION_PURGE_INTERVAL)